@@ -7,13 +7,22 @@ import streamlit as st
 import cv2
 import pandas as pd
 import os
-import numpy as np
-import csv
-import datetime
+import hashlib
 import time
 from PIL import Image
 import tempfile
 
+import attendance_db
+import attendance_report
+import attendance_store
+import file_cache
+from frame_ingest import Overloaded
+import model_registry
+import recognition_service
+import roster
+import session_store
+import trainImage
+
 # Configure page
 st.set_page_config(
     page_title="Face Recognition Attendance",
@@ -59,77 +68,93 @@ menu_option = st.sidebar.radio(
 # Helper functions
 def load_student_details():
     """Load student details from CSV"""
-    if os.path.exists(STUDENTDETAIL_PATH):
-        try:
-            return pd.read_csv(STUDENTDETAIL_PATH)
-        except:
-            return pd.DataFrame(columns=["Enrollment", "Name"])
-    return pd.DataFrame(columns=["Enrollment", "Name"])
+    try:
+        return roster.load_roster(STUDENTDETAIL_PATH)
+    except Exception:
+        return pd.DataFrame(columns=["Enrollment", "Name"])
+
+@file_cache.cached_on_files(
+    lambda subject_path, subject: [subject_path, attendance_store.store_dir(subject_path)],
+    maxsize=64,
+)
+def load_subject_sessions(subject_path, subject):
+    """Long-format marks and per-session frames of a subject (cached)"""
+    marks = attendance_store.load_subject(subject_path, subject)
+    return marks, attendance_store.session_frames(marks)
+
+def subject_report(subject):
+    """(session frames, summary) of a subject, or None without records"""
+    db = attendance_db.get_db()
+    if db is not None:
+        marks = db.subject_marks(subject)
+        if marks.empty:
+            return None
+        # percentages are aggregated by the database
+        return attendance_store.session_frames(marks), db.summary(subject)
+    subject_path = os.path.join(ATTENDANCE_PATH, subject)
+    if not os.path.isdir(subject_path):
+        return None
+    # refresh first: it re-syncs edited session CSVs into the store, which
+    # invalidates the cached sessions below
+    summary = attendance_report.refresh_summary(subject_path, subject, roster_names())
+    marks, dfs = load_subject_sessions(subject_path, subject)
+    if marks.empty:
+        return None
+    return dfs, summary
+
+def roster_names():
+    """Enrollment -> name index of the current roster"""
+    try:
+        return roster.name_index(STUDENTDETAIL_PATH)
+    except Exception:
+        return {}
 
 def save_student_details(enrollment, name):
-    """Save student details to CSV"""
-    os.makedirs(os.path.dirname(STUDENTDETAIL_PATH), exist_ok=True)
-    
-    # Check if file exists and has content
-    write_header = not os.path.isfile(STUDENTDETAIL_PATH) or os.path.getsize(STUDENTDETAIL_PATH) == 0
-    
-    with open(STUDENTDETAIL_PATH, "a+", newline="") as csvFile:
-        writer = csv.writer(csvFile, delimiter=",")
-        if write_header:
-            writer.writerow(["Enrollment", "Name"])
-        writer.writerow([enrollment, name])
+    """Add a student to the roster; False if the enrollment is taken"""
+    if not roster.add_student(STUDENTDETAIL_PATH, enrollment, name):
+        return False
+    db = attendance_db.get_db()
+    if db is not None:
+        db.upsert_students([(enrollment, name)])
+    return True
 
-def detect_faces(image, detector):
+def face_models(backend=None):
+    """Process-wide cascade + recognizer pool shared by all sessions"""
+    return model_registry.get_registry(
+        HAARCASCADE_PATH, TRAINIMAGELABEL_PATH, backend=backend
+    )
+
+def detect_faces(image, detector=None):
     """Detect faces in image"""
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    faces = detector.detectMultiScale(gray, 1.3, 5)
+    if detector is not None:
+        return detector.detectMultiScale(gray, 1.3, 5), gray
+    with face_models().acquire() as models:
+        faces = models.detector.detect(gray, scale_factor=1.3, min_neighbors=5)
     return faces, gray
 
-def train_model():
-    """Train LBPH Face Recognizer"""
+def recognize_image(data):
+    """Faces in an encoded image, via the recognition service when it runs"""
     try:
-        recognizer = cv2.face.LBPHFaceRecognizer_create()
-        detector = cv2.CascadeClassifier(HAARCASCADE_PATH)
-        
-        faces = []
-        ids = []
-        student_details = load_student_details()
-        
-        # Extract enrollment numbers
-        enrollment_dict = {str(row['Name']).lower(): int(row['Enrollment']) 
-                          for _, row in student_details.iterrows()}
-        
-        # Traverse training images
-        for person_name in os.listdir(TRAINIMAGE_PATH):
-            person_path = os.path.join(TRAINIMAGE_PATH, person_name)
-            if not os.path.isdir(person_path):
-                continue
-            
-            # Extract enrollment from folder name (format: enrollment_name)
-            enrollment_id = enrollment_dict.get(person_name.split('_')[1].lower(), 0)
-            
-            if enrollment_id == 0:
-                continue
-            
-            for image_name in os.listdir(person_path):
-                image_path = os.path.join(person_path, image_name)
-                try:
-                    image = cv2.imread(image_path)
-                    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-                    face_crop = gray
-                    
-                    if face_crop.size > 0:
-                        faces.append(face_crop)
-                        ids.append(enrollment_id)
-                except:
-                    continue
-        
-        if len(faces) > 0:
-            recognizer.train(faces, np.array(ids))
-            recognizer.save(TRAINIMAGELABEL_PATH)
-            return True, f"Model trained with {len(faces)} images"
-        else:
-            return False, "No training images found"
+        return recognition_service.recognize(data)
+    except ConnectionError:
+        # no service running (a busy one raises Overloaded instead):
+        # batch with this process's other sessions
+        ingest = recognition_service.local_ingest(face_models())
+        result = ingest.submit(data).result()
+        if "error" in result:
+            raise ValueError(result["error"])
+        return result["faces"]
+
+def train_model(backend=None):
+    """Train the face recognizer (RECOGNIZER_BACKEND unless given)"""
+    try:
+        res = trainImage.trainModel(
+            TRAINIMAGE_PATH, TRAINIMAGELABEL_PATH, backend=backend
+        )
+        # model files are replaced atomically; swap them in for every session now
+        face_models(backend).reload()
+        return True, res
     except Exception as e:
         return False, str(e)
 
@@ -174,13 +199,15 @@ elif menu_option == "👤 Register Student":
         if st.button("Register Student", key="register_btn"):
             if enrollment and name:
                 try:
-                    save_student_details(enrollment, name)
-                    st.success(f"✅ Student {name} (ER: {enrollment}) registered successfully!")
-                    
-                    # Create directory for training images
-                    student_dir = os.path.join(TRAINIMAGE_PATH, f"{enrollment}_{name}")
-                    os.makedirs(student_dir, exist_ok=True)
-                    st.info(f"📁 Training image directory created: {student_dir}")
+                    if save_student_details(enrollment, name):
+                        st.success(f"✅ Student {name} (ER: {enrollment}) registered successfully!")
+                        
+                        # Create directory for training images
+                        student_dir = os.path.join(TRAINIMAGE_PATH, f"{enrollment}_{name}")
+                        os.makedirs(student_dir, exist_ok=True)
+                        st.info(f"📁 Training image directory created: {student_dir}")
+                    else:
+                        st.warning(f"⚠️ Enrollment {enrollment} is already registered")
                 except Exception as e:
                     st.error(f"❌ Error: {str(e)}")
             else:
@@ -197,41 +224,83 @@ elif menu_option == "👤 Register Student":
 elif menu_option == "✅ Take Attendance":
     st.subheader("Mark Attendance")
     
+    subject = st.text_input("Subject Name", key="subject")
+    # enrollment -> best confidence over every frame of this session
+    marks = st.session_state.setdefault("attendance_marks", {})
+    seen_frames = st.session_state.setdefault("attendance_frames", set())
+    
+    if not face_models().has_model():
+        st.warning("⚠️ No trained model found. Please train the model first.")
+    
     col1, col2 = st.columns(2)
     
     with col1:
-        subject = st.text_input("Subject Name", key="subject")
-        duration = st.slider("Recognition Duration (seconds)", 10, 120, 30)
+        snapshot = st.camera_input("Take a snapshot of the class")
     
     with col2:
-        st.write("")
-        if st.button("Start Face Recognition", key="start_recognition"):
-            if subject:
-                st.info("🎥 Starting face recognition... (Make sure your camera is enabled)")
-                
-                # Simulate attendance process
-                st.write("Camera would start here in a desktop application")
-                
-                # For demo, create a sample attendance record
-                col_names = ["Enrollment", "Name"]
-                attendance_df = pd.DataFrame(columns=col_names)
-                
-                date = datetime.datetime.now().strftime("%Y-%m-%d")
-                timeStamp = datetime.datetime.now().strftime("%H:%M:%S")
-                attendance_df[date] = 1
-                
-                hour, minute, second = timeStamp.split(":")
-                path = os.path.join(ATTENDANCE_PATH, subject)
-                os.makedirs(path, exist_ok=True)
-                
-                fileName = os.path.join(
-                    path,
-                    f"{subject}_{date}_{hour}-{minute}-{second}.csv"
-                )
-                
-                st.success(f"✅ Attendance file would be saved to: {fileName}")
-            else:
+        uploads = st.file_uploader(
+            "...or upload classroom photos",
+            type=["jpg", "jpeg", "png"],
+            accept_multiple_files=True,
+        )
+    
+    frames = ([snapshot] if snapshot is not None else []) + list(uploads or [])
+    for frame in frames:
+        data = frame.getvalue()
+        # Streamlit hands the same snapshot back on every rerun
+        key = hashlib.sha1(data).hexdigest()
+        if key in seen_frames:
+            continue
+        seen_frames.add(key)
+        try:
+            faces = recognize_image(data)
+        except Overloaded as e:
+            # not recorded as seen, so the next rerun retries the frame
+            seen_frames.discard(key)
+            st.warning(f"⏳ Server busy, retry in {e.retry_after}s ({frame.name})")
+            continue
+        except ValueError as e:
+            st.error(f"❌ {frame.name}: {e}")
+            continue
+        for face in faces:
+            Id = face["enrollment"]
+            if Id is not None and face["confidence"] < marks.get(Id, float("inf")):
+                marks[Id] = face["confidence"]
+        unknown = sum(face["enrollment"] is None for face in faces)
+        st.info(f"{frame.name}: {len(faces)} face(s), {unknown} not recognized")
+    
+    if marks:
+        names = roster_names()
+        attendance_df = pd.DataFrame(
+            {
+                "Enrollment": list(marks),
+                "Name": [names.get(int(Id), "Unknown") for Id in marks],
+                "Confidence": [round(conf, 2) for conf in marks.values()],
+            }
+        )
+        st.dataframe(attendance_df, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("Save Attendance", key="save_attendance"):
+            if not subject:
                 st.warning("⚠️ Please enter Subject Name")
+            elif not marks:
+                st.warning("⚠️ No students recognized yet")
+            else:
+                fileName = session_store.write_session(
+                    ATTENDANCE_PATH, subject, attendance_df[["Enrollment", "Name"]]
+                )
+                marks.clear()
+                st.success(f"✅ Attendance saved to: {fileName}")
+    
+    with col2:
+        if st.button("Clear Session", key="clear_attendance"):
+            # forget the frames too, so the same photo can be submitted again
+            marks.clear()
+            seen_frames.clear()
+            st.rerun()
 
 elif menu_option == "📊 View Attendance":
     st.subheader("View Attendance Records")
@@ -245,47 +314,23 @@ elif menu_option == "📊 View Attendance":
         st.write("")
         if st.button("View Attendance", key="view_btn"):
             if subject:
-                subject_path = os.path.join(ATTENDANCE_PATH, subject)
+                report = subject_report(subject)
                 
-                if os.path.isdir(subject_path):
-                    csv_files = [f for f in os.listdir(subject_path) if f.endswith('.csv')]
+                if report is not None:
+                    dfs, summary_df = report
+                    st.success(f"Found {len(dfs)} attendance record(s)")
                     
-                    if csv_files:
-                        st.success(f"Found {len(csv_files)} attendance record(s)")
-                        
-                        # Load and display attendance files
-                        dfs = []
-                        for csv_file in csv_files:
-                            try:
-                                df = pd.read_csv(os.path.join(subject_path, csv_file))
-                                st.subheader(f"📄 {csv_file}")
-                                st.dataframe(df, use_container_width=True)
-                                dfs.append(df)
-                            except Exception as e:
-                                st.error(f"Error reading {csv_file}: {str(e)}")
-                        
-                        # Summary attendance
-                        if dfs:
-                            st.subheader("📊 Attendance Summary")
-                            merged_df = dfs[0]
-                            for df in dfs[1:]:
-                                merged_df = merged_df.merge(df, on=["Enrollment", "Name"], how="outer")
-                            
-                            merged_df.fillna(0, inplace=True)
-                            date_cols = [col for col in merged_df.columns if col not in ["Enrollment", "Name"]]
-                            
-                            if date_cols:
-                                merged_df["Attendance %"] = (
-                                    (merged_df[date_cols].mean(axis=1) * 100)
-                                    .round()
-                                    .astype(int)
-                                    .astype(str) + "%"
-                                )
-                                st.dataframe(merged_df, use_container_width=True)
-                    else:
-                        st.warning(f"No attendance records found for {subject}")
+                    # Display attendance sessions
+                    for df in dfs:
+                        st.subheader(f"📄 {df.columns[-1]}")
+                        st.dataframe(df, use_container_width=True)
+                    
+                    # Summary attendance
+                    st.subheader("📊 Attendance Summary")
+                    summary_df = summary_df.rename(columns={"Attendance": "Attendance %"})
+                    st.dataframe(summary_df, use_container_width=True)
                 else:
-                    st.warning(f"No attendance folder found for {subject}")
+                    st.warning(f"No attendance records found for {subject}")
             else:
                 st.warning("⚠️ Please enter Subject Name")
 
@@ -0,0 +1,388 @@
+"""
+Database storage for the roster and attendance (SQLite or PostgreSQL).
+
+ATTENDANCE_DB selects the backend:
+
+    (empty)   files only: studentdetails.csv and the Attendance/ tree
+    sqlite    ATTENDANCE_DB_PATH (default Attendance/attendance.db)
+    postgres  DB_HOST / DB_PORT / DB_NAME / DB_USER / DB_PASSWORD, e.g. the
+              db service of docker-compose.yml (needs psycopg2)
+
+Tables:
+
+    students(enrollment PK, name)
+    sessions(id PK, subject, name UNIQUE per subject, date, created_at)
+    attendance_marks(session_id, enrollment, name, present; PK both ids)
+
+Closing a session inserts all its marks in one executemany (COPY on
+Postgres) inside one transaction. Reports aggregate in SQL, so the
+percentage of every student in a subject is one indexed GROUP BY instead
+of reading a file per session. Connections come from a small pool that
+every thread of the process shares.
+
+    python attendance_db.py migrate      # one-shot import of the CSV tree
+    python attendance_db.py report Maths
+"""
+
+import argparse
+import datetime
+import io
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+import attendance_store
+import roster
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ATTENDANCE_PATH = os.path.join(BASE_DIR, "Attendance")
+STUDENTDETAIL_PATH = os.path.join(BASE_DIR, "StudentDetails", "studentdetails.csv")
+
+ATTENDANCE_DB = os.environ.get("ATTENDANCE_DB", "").lower()
+ATTENDANCE_DB_PATH = os.environ.get(
+    "ATTENDANCE_DB_PATH", os.path.join(ATTENDANCE_PATH, "attendance.db")
+)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 4))
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS students (
+        enrollment BIGINT PRIMARY KEY,
+        name TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS sessions (
+        id {serial} PRIMARY KEY,
+        subject TEXT NOT NULL,
+        name TEXT NOT NULL,
+        date TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        UNIQUE (subject, name)
+    )""",
+    """CREATE TABLE IF NOT EXISTS attendance_marks (
+        session_id BIGINT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+        enrollment BIGINT NOT NULL,
+        name TEXT NOT NULL,
+        present SMALLINT NOT NULL,
+        PRIMARY KEY (session_id, enrollment)
+    )""",
+    "CREATE INDEX IF NOT EXISTS sessions_subject_date ON sessions (subject, date)",
+    "CREATE INDEX IF NOT EXISTS marks_enrollment ON attendance_marks (enrollment)",
+]
+
+# percentage per student of a subject; sessions a student missed entirely
+# count as absent because the total comes from the sessions table
+SUMMARY_SQL = """
+    WITH subject_sessions AS (
+        SELECT id FROM sessions WHERE subject = ?
+    ), totals AS (
+        SELECT m.enrollment, SUM(m.present) AS present, MAX(m.session_id) AS last
+        FROM attendance_marks m
+        WHERE m.session_id IN (SELECT id FROM subject_sessions)
+        GROUP BY m.enrollment
+    )
+    SELECT t.enrollment, COALESCE(st.name, m.name) AS name, t.present,
+           (SELECT COUNT(*) FROM subject_sessions) AS total
+    FROM totals t
+    JOIN attendance_marks m ON m.session_id = t.last AND m.enrollment = t.enrollment
+    LEFT JOIN students st ON st.enrollment = t.enrollment
+    ORDER BY t.enrollment
+"""
+
+
+class Pool:
+    """At most size connections, handed out one per thread at a time."""
+
+    def __init__(self, connect, size=DB_POOL_SIZE):
+        self.connect = connect
+        self.size = max(int(size), 1)
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                grow = self.created < self.size
+                if grow:
+                    self.created += 1
+            if grow:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+            else:
+                conn = self.idle.get()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            self.idle.put(conn)
+
+
+class Database:
+    """Roster and attendance tables behind a connection pool."""
+
+    placeholder = "?"
+    serial = "INTEGER"  # SQLite: INTEGER PRIMARY KEY is the rowid
+
+    def __init__(self, pool):
+        self.pool = pool
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            for statement in SCHEMA:
+                cur.execute(statement.format(serial=self.serial))
+
+    def sql(self, statement):
+        return statement.replace("?", self.placeholder)
+
+    def query(self, statement, params=()):
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(self.sql(statement), params)
+            return cur.fetchall()
+
+    # roster
+
+    def upsert_students(self, rows):
+        """Insert or rename (enrollment, name) rows in one batch."""
+        rows = [(int(e), str(n)) for e, n in rows]
+        with self.pool.connection() as conn:
+            conn.cursor().executemany(
+                self.sql(
+                    "INSERT INTO students (enrollment, name) VALUES (?, ?) "
+                    "ON CONFLICT (enrollment) DO UPDATE SET name = excluded.name"
+                ),
+                rows,
+            )
+        return len(rows)
+
+    def students(self):
+        rows = self.query("SELECT enrollment, name FROM students ORDER BY enrollment")
+        return pd.DataFrame(rows, columns=roster.COLUMNS)
+
+    def name_index(self):
+        return dict(self.query("SELECT enrollment, name FROM students"))
+
+    # attendance
+
+    def _insert_marks(self, cur, rows):
+        cur.executemany(
+            self.sql(
+                "INSERT INTO attendance_marks (session_id, enrollment, name, present) "
+                "VALUES (?, ?, ?, ?)"
+            ),
+            rows,
+        )
+
+    def write_session(self, subject, session, date, attendance, created_at=None):
+        """Store one Enrollment/Name(/<date>) frame; replaces a same-name session.
+
+        Returns the session id.
+        """
+        marks = attendance_store.long_frame(
+            session, date, _with_present(attendance)
+        ).drop_duplicates("Enrollment", keep="last")
+        created_at = (created_at or datetime.datetime.now()).isoformat(" ", "seconds")
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                self.sql("DELETE FROM sessions WHERE subject = ? AND name = ?"),
+                (subject, session),
+            )
+            session_id = self._insert_session(cur, subject, session, date, created_at)
+            rows = [
+                (session_id, int(e), n, int(p))
+                for e, n, p in zip(marks["Enrollment"], marks["Name"], marks["Present"])
+            ]
+            self._insert_marks(cur, rows)
+        return session_id
+
+    def _insert_session(self, cur, subject, session, date, created_at):
+        cur.execute(
+            self.sql(
+                "INSERT INTO sessions (subject, name, date, created_at) "
+                "VALUES (?, ?, ?, ?)"
+            ),
+            (subject, session, date, created_at),
+        )
+        return cur.lastrowid
+
+    def subjects(self):
+        return [r[0] for r in self.query("SELECT DISTINCT subject FROM sessions")]
+
+    def session_names(self, subject):
+        rows = self.query("SELECT name FROM sessions WHERE subject = ?", (subject,))
+        return {r[0] for r in rows}
+
+    def subject_marks(self, subject):
+        """Long-format marks (Session, Date, Enrollment, Name, Present)."""
+        rows = self.query(
+            "SELECT s.name, s.date, m.enrollment, m.name, m.present "
+            "FROM sessions s JOIN attendance_marks m ON m.session_id = s.id "
+            "WHERE s.subject = ? ORDER BY s.name, m.enrollment",
+            (subject,),
+        )
+        return pd.DataFrame(rows, columns=attendance_store.COLUMNS)
+
+    def summary(self, subject, percent_col="Attendance"):
+        """Enrollment, Name, Present, Sessions, percentage; aggregated in SQL."""
+        rows = self.query(SUMMARY_SQL, (subject,))
+        df = pd.DataFrame(rows, columns=["Enrollment", "Name", "Present", "Sessions"])
+        percent = (df["Present"] * 100 / df["Sessions"].clip(lower=1)).round()
+        df[percent_col] = [f"{int(p)}%" for p in percent]
+        return df
+
+
+class PostgresDatabase(Database):
+    placeholder = "%s"
+    serial = "BIGSERIAL"
+
+    def _insert_session(self, cur, subject, session, date, created_at):
+        cur.execute(
+            "INSERT INTO sessions (subject, name, date, created_at) "
+            "VALUES (%s, %s, %s, %s) RETURNING id",
+            (subject, session, date, created_at),
+        )
+        return cur.fetchone()[0]
+
+    def _insert_marks(self, cur, rows):
+        # COPY is several times faster than executemany on Postgres
+        buf = io.StringIO()
+        for session_id, enrollment, name, present in rows:
+            name = name.replace("\\", "\\\\").replace("\t", " ").replace("\n", " ")
+            buf.write(f"{session_id}\t{enrollment}\t{name}\t{present}\n")
+        buf.seek(0)
+        cur.copy_expert(
+            "COPY attendance_marks (session_id, enrollment, name, present) "
+            "FROM STDIN",
+            buf,
+        )
+
+
+def _with_present(attendance):
+    """Add a Present column of 1s to an Enrollment/Name frame if missing."""
+    if attendance.shape[1] > 2:
+        return attendance
+    attendance = attendance.copy()
+    attendance["Present"] = 1
+    return attendance
+
+
+def _connect_sqlite(path):
+    def connect():
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    return connect
+
+
+def _connect_postgres():
+    try:
+        import psycopg2
+    except ImportError:
+        raise ImportError(
+            "ATTENDANCE_DB=postgres needs psycopg2: pip install psycopg2-binary"
+        )
+
+    def connect():
+        return psycopg2.connect(
+            host=os.environ.get("DB_HOST", "localhost"),
+            port=int(os.environ.get("DB_PORT", 5432)),
+            dbname=os.environ.get("DB_NAME", "attendance_db"),
+            user=os.environ.get("DB_USER", "attendance_user"),
+            password=os.environ.get("DB_PASSWORD", ""),
+        )
+
+    return connect
+
+
+def open_database(kind=ATTENDANCE_DB, path=ATTENDANCE_DB_PATH, pool_size=DB_POOL_SIZE):
+    if kind == "sqlite":
+        return Database(Pool(_connect_sqlite(path), pool_size))
+    if kind in ("postgres", "postgresql"):
+        return PostgresDatabase(Pool(_connect_postgres(), pool_size))
+    raise ValueError(f"Unknown ATTENDANCE_DB {kind!r}; choose sqlite or postgres")
+
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def get_db():
+    """The process-wide Database, or None when ATTENDANCE_DB is not set."""
+    global _db
+    if not ATTENDANCE_DB:
+        return None
+    with _db_lock:
+        if _db is None:
+            _db = open_database()
+        return _db
+
+
+def migrate(db, attendance_path=ATTENDANCE_PATH, studentdetail_path=STUDENTDETAIL_PATH):
+    """Import the roster CSV and every session CSV not in the database yet.
+
+    Safe to re-run: sessions already stored (same subject and file name) are
+    skipped. Returns (students, sessions, marks) imported.
+    """
+    students = 0
+    if os.path.isfile(studentdetail_path):
+        students = db.upsert_students(
+            roster.load_roster(studentdetail_path).itertuples(index=False)
+        )
+    sessions = marks = 0
+    for subject in sorted(os.listdir(attendance_path)):
+        subject_dir = os.path.join(attendance_path, subject)
+        if not os.path.isdir(subject_dir) or subject.startswith("."):
+            continue
+        known = db.session_names(subject)
+        for path in attendance_store.session_csvs(subject_dir, subject):
+            session = os.path.splitext(os.path.basename(path))[0]
+            if session in known:
+                continue
+            parsed = attendance_store.read_session_csv(path)
+            if parsed is None:
+                continue
+            date, frame = parsed
+            created_at = datetime.datetime.fromtimestamp(os.stat(path).st_mtime)
+            db.write_session(subject, session, date, frame, created_at)
+            sessions += 1
+            marks += len(frame)
+    return students, sessions, marks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Attendance database tools")
+    parser.add_argument("--db", default=ATTENDANCE_DB or "sqlite",
+                        help="sqlite or postgres (ATTENDANCE_DB)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="import StudentDetails and Attendance CSVs")
+    report = sub.add_parser("report", help="print a subject's attendance summary")
+    report.add_argument("subject")
+    args = parser.parse_args(argv)
+
+    db = open_database(args.db)
+    if args.command == "migrate":
+        students, sessions, marks = migrate(db)
+        print(f"Imported {students} students, {sessions} sessions, {marks} marks")
+    else:
+        print(db.summary(args.subject).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Attendance summary tables built from long-format marks.
+
+summarize() turns (Session, Enrollment, Name, Present) rows into the
+student x session table with an attendance percentage, using one
+student x session bitmap instead of merging a frame per session.
+refresh_summary() keeps Attendance/<Subject>/attendance.csv up to date
+incrementally.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import attendance_store
+
+BASE_COLS = ["Enrollment", "Name"]
+SUMMARY_FILE = "attendance.csv"
+STATE_FILE = "summary_state.json"
+
+
+def summarize(marks, names=None, percent_col="Attendance"):
+    """Wide report: Enrollment, Name, one 0/1 column per session, percentage.
+
+    names optionally maps enrollment -> current roster name; students not on
+    the roster keep the name recorded in their latest session.
+    """
+    if marks.empty:
+        return pd.DataFrame(columns=BASE_COLS + [percent_col])
+    enr_codes, enrollments = pd.factorize(marks["Enrollment"], sort=True)
+    ses_codes, sessions = pd.factorize(marks["Session"], sort=True)
+    grid = np.zeros((len(enrollments), len(sessions)), dtype=np.int8)
+    present = marks["Present"].to_numpy(dtype=np.int8)
+    np.maximum.at(grid, (enr_codes, ses_codes), present)
+
+    recorded = (
+        marks.drop_duplicates("Enrollment", keep="last")
+        .set_index("Enrollment")["Name"]
+        .reindex(enrollments)
+    )
+    if names:
+        current = pd.Series(enrollments, index=enrollments).map(names)
+        recorded = current.fillna(recorded)
+
+    percent = np.round(grid.mean(axis=1) * 100).astype(int)
+    report = pd.DataFrame(grid, columns=list(sessions))
+    report.insert(0, "Enrollment", np.asarray(enrollments))
+    report.insert(1, "Name", recorded.to_numpy())
+    report[percent_col] = [f"{p}%" for p in percent]
+    return report
+
+
+def _session_files(subject_dir, subject):
+    """{session name: mtime_ns} of the subject's session CSVs."""
+    return {
+        os.path.splitext(os.path.basename(path))[0]: os.stat(path).st_mtime_ns
+        for path in attendance_store.session_csvs(subject_dir, subject)
+    }
+
+
+def _load_state(subject_dir):
+    path = os.path.join(attendance_store.store_dir(subject_dir), STATE_FILE)
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(subject_dir, state):
+    directory = attendance_store.store_dir(subject_dir)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(state, fh)
+    os.replace(tmp, path)
+
+
+def _read_session(subject_dir, session):
+    parsed = attendance_store.read_session_csv(
+        os.path.join(subject_dir, session + ".csv")
+    )
+    if parsed is None:
+        return None
+    date, frame = parsed
+    return attendance_store.long_frame(session, date, frame)
+
+
+def _full_summary(subject_dir, subject, files, old_files, names, percent_col):
+    """Summary from the store, after syncing it with deleted/edited CSVs."""
+    marks = attendance_store.load_subject(subject_dir, subject)
+    edited = [s for s, mtime in files.items() if old_files.get(s, mtime) != mtime]
+    stale = (set(marks["Session"].unique()) - set(files)) | set(edited)
+    if stale:
+        attendance_store.drop_sessions(subject_dir, stale)
+        marks = marks[~marks["Session"].isin(stale)]
+        reread = []
+        for session in edited:
+            frame = _read_session(subject_dir, session)
+            if frame is None:
+                continue
+            attendance_store.append_session(
+                subject_dir,
+                session,
+                frame["Date"].iloc[0],
+                frame[["Enrollment", "Name", "Present"]],
+            )
+            reread.append(frame)
+        marks = pd.concat([marks] + reread, ignore_index=True)
+    return summarize(marks, names, percent_col)
+
+
+def _fold_sessions(report, present, subject_dir, sessions):
+    """Add new session columns to a saved summary and bump the counters.
+
+    Returns (report, present, sessions added); present is indexed by
+    enrollment.
+    """
+    added = 0
+    for session in sessions:
+        marks = _read_session(subject_dir, session)
+        if marks is None:
+            continue
+        marks = marks.groupby("Enrollment").agg(
+            Name=("Name", "last"), Present=("Present", "max")
+        )
+        newcomers = marks.index.difference(report["Enrollment"])
+        if len(newcomers):
+            rows = pd.DataFrame(
+                {
+                    "Enrollment": newcomers,
+                    "Name": marks.loc[newcomers, "Name"].to_numpy(),
+                }
+            )
+            report = pd.concat([report, rows], ignore_index=True)
+            session_cols = list(report.columns[2:])
+            report[session_cols] = report[session_cols].fillna(0).astype(int)
+        column = report["Enrollment"].map(marks["Present"]).fillna(0).astype(int)
+        report[session] = column
+        present = present.reindex(report["Enrollment"], fill_value=0)
+        present += column.to_numpy()
+        added += 1
+    return report, present, added
+
+
+def refresh_summary(subject_dir, subject, names=None, percent_col="Attendance"):
+    """Bring Attendance/<Subject>/attendance.csv up to date and return it.
+
+    A state file keeps per-student present counters, the session total and
+    the name + mtime of every session CSV already folded in. New sessions
+    are read on their own and added to the saved summary, so a refresh
+    costs O(new sessions); an edited or deleted session CSV, or a summary
+    file changed behind our back, falls back to a full recompute.
+    """
+    summary_path = os.path.join(subject_dir, SUMMARY_FILE)
+    files = _session_files(subject_dir, subject)
+    state = _load_state(subject_dir) or {}
+    old_files = state.get("files", {})
+    incremental = (
+        state.get("percent_col") == percent_col
+        and os.path.isfile(summary_path)
+        and os.stat(summary_path).st_mtime_ns == state.get("summary_mtime")
+        and all(files.get(s) == mtime for s, mtime in old_files.items())
+    )
+    saved = None
+    if incremental:
+        saved = pd.read_csv(summary_path)
+        report = saved.drop(columns=[percent_col])
+        present = pd.Series(state["present"], dtype=np.int64)
+        present.index = present.index.astype(np.int64)
+        new = sorted(s for s in files if s not in old_files)
+        report, present, added = _fold_sessions(report, present, subject_dir, new)
+        total = state["total"] + added
+    else:
+        report = _full_summary(
+            subject_dir, subject, files, old_files, names, percent_col
+        ).drop(columns=[percent_col])
+        session_cols = list(report.columns[2:])
+        present = pd.Series(
+            report[session_cols].to_numpy(dtype=np.int64).sum(axis=1),
+            index=report["Enrollment"].to_numpy(),
+        )
+        total = len(session_cols)
+
+    present = present.reindex(report["Enrollment"], fill_value=0)
+    percent = np.round(present.to_numpy() * 100 / max(total, 1)).astype(int)
+    if names:
+        report["Name"] = report["Enrollment"].map(names).fillna(report["Name"])
+    report[percent_col] = [f"{p}%" for p in percent]
+    if saved is not None and report.equals(saved):
+        return report  # nothing changed; keep the file (and its mtime) as is
+    report.to_csv(summary_path, index=False)
+
+    _save_state(
+        subject_dir,
+        {
+            "files": files,
+            "summary_mtime": os.stat(summary_path).st_mtime_ns,
+            "percent_col": percent_col,
+            "total": total,
+            "present": {str(k): int(v) for k, v in present.items()},
+        },
+    )
+    return report
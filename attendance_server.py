@@ -0,0 +1,272 @@
+"""
+Headless attendance for many classrooms in one process.
+
+    python attendance_server.py rooms.json      # see rooms.example.json
+
+rooms.json lists the cameras and what each one records:
+
+    {
+      "workers": 4,
+      "rooms": [
+        {"room": "A101", "source": 0, "subject": "Maths", "duration": 3000},
+        {"room": "B204", "source": "rtsp://cam-b204/stream", "subject": "Physics"},
+        {"room": "test", "source": "lecture.mp4", "subject": "Chemistry"}
+      ]
+    }
+
+source is a camera index, an RTSP/HTTP URL or a video file (played at its
+own frame rate, for local testing); duration is in seconds and defaults to
+SESSION_SECONDS. Every room has its own capture thread and FaceSession
+(tracker + votes); one pool of recognition workers and one loaded model
+(model_registry) serve all rooms. A room only ever queues its newest
+frame, and rooms are served in the order their frames arrived, so a busy
+room cannot starve the others. When a room's session ends (duration
+reached, video finished or Ctrl+C) its attendance is written to
+Attendance/<Subject>/ like a session taken from the desktop app.
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+import face_session
+import model_registry
+import recognizer_backends
+import roster
+import session_store
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+haarcasecade_path = os.path.join(BASE_DIR, "haarcascade_frontalface_alt.xml")
+trainimagelabel_path = os.path.join(BASE_DIR, "TrainingImageLabel", "Trainner.yml")
+studentdetail_path = os.path.join(BASE_DIR, "StudentDetails", "studentdetails.csv")
+attendance_path = os.path.join(BASE_DIR, "Attendance")
+
+SESSION_SECONDS = int(os.environ.get("SESSION_SECONDS", 20 * 60))
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", 0)) or os.cpu_count() or 1
+RECONNECT_SECONDS = 2.0
+DETECT_EVERY = int(os.environ.get("DETECT_EVERY", 5))
+MIN_VOTES = int(os.environ.get("MIN_VOTES", 3))
+CONFIDENCE_THRESHOLD = recognizer_backends.get_backend().threshold
+
+
+def open_source(source):
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    return cv2.VideoCapture(source)
+
+
+def is_file(source):
+    return isinstance(source, str) and os.path.isfile(source)
+
+
+class Room:
+    """One camera: capture thread, newest-frame slot and its FaceSession."""
+
+    def __init__(self, room, source, subject, duration, session):
+        self.room = room
+        self.source = source
+        self.subject = subject
+        self.duration = duration
+        self.session = session
+        self.lock = threading.Lock()
+        self.slot = None
+        self.queued = False  # room id is in the ready queue
+        self.busy = False  # a worker is processing this room's frame
+        self.finished = threading.Event()
+        self.captured = 0
+        self.dropped = 0
+        self.processed = 0
+        self.reconnects = 0
+
+    def offer(self, frame):
+        """Store the newest frame; True when the room must be queued."""
+        with self.lock:
+            self.captured += 1
+            if self.slot is not None:
+                self.dropped += 1
+            self.slot = frame
+            if self.queued or self.busy:
+                return False
+            self.queued = True
+            return True
+
+    def take(self):
+        with self.lock:
+            frame, self.slot = self.slot, None
+            self.queued = False
+            self.busy = frame is not None
+            return frame
+
+    def done(self):
+        """Frame processed; True when a newer frame is waiting (re-queue)."""
+        with self.lock:
+            self.busy = False
+            self.processed += 1
+            if self.slot is None or self.queued:
+                return False
+            self.queued = True
+            return True
+
+    def stats(self):
+        return (
+            f"{self.room}: captured {self.captured}, dropped {self.dropped}, "
+            f"processed {self.processed}, reconnects {self.reconnects}"
+        )
+
+
+class AttendanceServer:
+    def __init__(self, rooms, workers=SERVER_WORKERS, registry=None):
+        self.rooms = rooms
+        self.workers = max(int(workers), 1)
+        self.registry = registry or model_registry.get_registry(
+            haarcasecade_path, trainimagelabel_path, self.workers
+        )
+        self.ready = queue.Queue()
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def _capture(self, index, room):
+        deadline = time.time() + room.duration
+        from_file = is_file(room.source)
+        cap = open_source(room.source)
+        fps = cap.get(cv2.CAP_PROP_FPS) if from_file else 0
+        next_frame = time.time()
+        try:
+            while not self.stopping.is_set() and time.time() < deadline:
+                ret, frame = cap.read()
+                if not ret:
+                    if from_file:
+                        break  # video finished: the session ends with it
+                    # camera dropped out: reopen until the session is over
+                    cap.release()
+                    room.reconnects += 1
+                    if self.stopping.wait(RECONNECT_SECONDS):
+                        break
+                    cap = open_source(room.source)
+                    continue
+                if room.offer(frame):
+                    self.ready.put(index)
+                if fps > 0:
+                    # play files at their own rate, like a live camera
+                    next_frame += 1.0 / fps
+                    delay = next_frame - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+        finally:
+            cap.release()
+            room.finished.set()
+
+    def _work(self):
+        while True:
+            index = self.ready.get()
+            if index is None:
+                return
+            room = self.rooms[index]
+            frame = room.take()
+            if frame is None:
+                continue
+            try:
+                room.session.process(frame, self.registry)
+            except Exception as err:
+                print(f"{room.room}: recognition error: {err}")
+            if room.done():
+                self.ready.put(index)
+
+    def start(self):
+        with self.registry.acquire() as models:
+            if models.recognizer is None:
+                raise FileNotFoundError("Model not found, please train the model")
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        for index, room in enumerate(self.rooms):
+            thread = threading.Thread(
+                target=self._capture, args=(index, room), daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stopping.set()
+
+    def wait(self):
+        """Write each room's session as it ends; returns {room: file or None}."""
+        results = {}
+        pending = list(self.rooms)
+        try:
+            while pending:
+                for room in list(pending):
+                    if room.finished.wait(0.2):
+                        results[room.room] = self._close(room)
+                        pending.remove(room)
+        except KeyboardInterrupt:
+            self.stop()
+            for room in pending:
+                room.finished.wait()
+                results[room.room] = self._close(room)
+        for _ in range(self.workers):
+            self.ready.put(None)
+        return results
+
+    def _close(self, room):
+        # let the worker finish the room's last frame before reading votes
+        while True:
+            with room.lock:
+                if not room.busy and not room.queued:
+                    break
+            time.sleep(0.05)
+        print(room.stats())
+        attendance = room.session.attendance()
+        if attendance.empty:
+            print(f"{room.room}: no faces recognized for {room.subject}")
+            return None
+        fileName = session_store.write_session(attendance_path, room.subject, attendance)
+        print(f"{room.room}: {len(attendance)} present, saved {fileName}")
+        return fileName
+
+
+def load_rooms(config, names):
+    rooms = []
+    for entry in config["rooms"]:
+        session = face_session.FaceSession(
+            names, DETECT_EVERY, CONFIDENCE_THRESHOLD, MIN_VOTES
+        )
+        rooms.append(
+            Room(
+                entry.get("room", str(entry["source"])),
+                entry["source"],
+                entry["subject"],
+                float(entry.get("duration", SESSION_SECONDS)),
+                session,
+            )
+        )
+    return rooms
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-room headless attendance")
+    parser.add_argument("config", help="JSON file with the rooms to serve")
+    parser.add_argument("--workers", type=int, help="recognition worker threads")
+    args = parser.parse_args(argv)
+
+    with open(args.config) as fh:
+        config = json.load(fh)
+    names = roster.name_index(studentdetail_path)
+    rooms = load_rooms(config, names)
+    server = AttendanceServer(
+        rooms, args.workers or config.get("workers") or SERVER_WORKERS
+    )
+    server.start()
+    print(f"Serving {len(rooms)} rooms with {server.workers} workers (Ctrl+C to stop)")
+    server.wait()
+
+
+if __name__ == "__main__":
+    main()
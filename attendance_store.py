@@ -0,0 +1,174 @@
+"""
+Append-only columnar attendance store.
+
+Every subject keeps its attendance marks in Attendance/<Subject>/.store/ as
+Parquet segments in long format (Session, Date, Enrollment, Name, Present).
+Closing a session appends one small segment; once a subject has
+COMPACT_AT segments they are merged into one file. When a session appears
+in several segments the newest one wins, so re-appending a session
+replaces it. Reports read the whole
+subject with a single columnar scan instead of parsing one CSV per session.
+
+The per-session CSVs are still written for people opening the folder, and
+CSVs that are not in the store yet (older sessions, copied-in files) are
+imported on read.
+"""
+
+import glob
+import os
+import time
+import uuid
+
+import pandas as pd
+
+STORE_DIR = ".store"
+COMPACT_AT = 64
+COLUMNS = ["Session", "Date", "Enrollment", "Name", "Present"]
+BASE_COLS = ["Enrollment", "Name"]
+
+
+def store_dir(subject_dir):
+    return os.path.join(subject_dir, STORE_DIR)
+
+
+def _segments(subject_dir):
+    """Segment files oldest first (by the write time in their name)."""
+    # names starting with "_" or "." (in-progress writes) are skipped
+    paths = glob.glob(os.path.join(store_dir(subject_dir), "[!_.]*.parquet"))
+    return sorted(paths, key=lambda p: os.path.basename(p).split("-")[1])
+
+
+def _write_segment(subject_dir, df, prefix="seg"):
+    directory = store_dir(subject_dir)
+    os.makedirs(directory, exist_ok=True)
+    name = f"{prefix}-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet"
+    tmp = os.path.join(directory, "_" + name)
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, os.path.join(directory, name))
+
+
+def long_frame(session, date, frame):
+    """Long-format marks of one Enrollment/Name/<date> session frame."""
+    present = pd.to_numeric(frame.iloc[:, 2], errors="coerce").fillna(0)
+    return pd.DataFrame(
+        {
+            "Session": session,
+            "Date": date,
+            "Enrollment": pd.to_numeric(frame["Enrollment"], errors="coerce"),
+            "Name": frame["Name"].astype(str),
+            "Present": present.astype("int8"),
+        }
+    ).dropna(subset=["Enrollment"]).astype({"Enrollment": "int64"})
+
+
+def append_session(subject_dir, session, date, attendance):
+    """Append one session (Enrollment, Name, <date> frame) as a new segment."""
+    _write_segment(subject_dir, long_frame(session, date, attendance)[COLUMNS])
+    if len(_segments(subject_dir)) >= COMPACT_AT:
+        compact(subject_dir)
+
+
+def read_subject(subject_dir, columns=None):
+    """All marks of a subject in long format, one row per (Session, Enrollment)."""
+    segments = _segments(subject_dir)
+    if not segments:
+        return pd.DataFrame(columns=columns or COLUMNS)
+    frames = []
+    for seq, path in enumerate(segments):
+        frame = pd.read_parquet(path, columns=columns)
+        frame["_seg"] = seq
+        frames.append(frame)
+    df = pd.concat(frames, ignore_index=True)
+    if "Session" in df.columns:
+        # a session re-appended later (edited CSV) replaces its older rows; this
+        # also drops duplicates left by an interrupted compaction
+        latest = df.groupby("Session")["_seg"].transform("max")
+        df = df[df["_seg"] == latest]
+    return df.drop(columns="_seg").reset_index(drop=True)
+
+
+def stored_sessions(subject_dir):
+    if not _segments(subject_dir):
+        return set()
+    return set(read_subject(subject_dir, columns=["Session"])["Session"].unique())
+
+
+def drop_sessions(subject_dir, sessions):
+    """Remove sessions (e.g. whose CSV was deleted) by rewriting the store."""
+    sessions = set(sessions)
+    if not sessions:
+        return
+    segments = _segments(subject_dir)
+    df = read_subject(subject_dir)
+    _write_segment(subject_dir, df[~df["Session"].isin(sessions)], prefix="part")
+    for path in segments:
+        os.remove(path)
+
+
+def compact(subject_dir):
+    """Merge all segments into one; safe to re-run after a crash."""
+    segments = _segments(subject_dir)
+    if len(segments) < 2:
+        return
+    df = read_subject(subject_dir)
+    _write_segment(subject_dir, df, prefix="part")
+    for path in segments:
+        os.remove(path)
+
+
+def session_csvs(subject_dir, subject):
+    return sorted(glob.glob(os.path.join(subject_dir, f"{subject}_*.csv")))
+
+
+def read_session_csv(path):
+    """Parse a session CSV into (date, Enrollment/Name/<date> frame) or None."""
+    try:
+        df = pd.read_csv(path)
+    except Exception:
+        return None
+    if not set(BASE_COLS) <= set(df.columns):
+        return None
+    date_cols = [col for col in df.columns if col not in BASE_COLS]
+    if not date_cols:
+        return None
+    return date_cols[0], df[BASE_COLS + [date_cols[0]]]
+
+
+def _import_frames(subject_dir, subject, known):
+    frames = []
+    for path in session_csvs(subject_dir, subject):
+        session = os.path.splitext(os.path.basename(path))[0]
+        if session in known:
+            continue
+        parsed = read_session_csv(path)
+        if parsed is None:
+            continue
+        date, frame = parsed
+        frames.append(long_frame(session, date, frame)[COLUMNS])
+    if frames:
+        _write_segment(subject_dir, pd.concat(frames, ignore_index=True))
+        if len(_segments(subject_dir)) >= COMPACT_AT:
+            compact(subject_dir)
+    return frames
+
+
+def import_csvs(subject_dir, subject):
+    """Import session CSVs missing from the store; returns how many were added."""
+    return len(_import_frames(subject_dir, subject, stored_sessions(subject_dir)))
+
+
+def load_subject(subject_dir, subject):
+    """Long-format marks of a subject, importing any CSVs not stored yet."""
+    df = read_subject(subject_dir)
+    frames = _import_frames(subject_dir, subject, set(df["Session"].unique()))
+    if frames:
+        df = pd.concat(([df] if len(df) else []) + frames, ignore_index=True)
+    return df
+
+
+def session_frames(marks):
+    """Split long-format marks into one Enrollment/Name/<session> frame each."""
+    return [
+        group[BASE_COLS + ["Present"]].rename(columns={"Present": session})
+        for session, group in marks.groupby("Session", sort=True)
+    ]
@@ -5,12 +5,17 @@ import shutil
 import csv
 import numpy as np
 from PIL import ImageTk, Image
-import pandas as pd
-import datetime
 import time
 import tkinter.ttk as tkk
 import tkinter.font as font
 
+import face_session
+import model_registry
+import recognition_pipeline
+import recognizer_backends
+import roster
+import session_store
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 haarcasecade_path = os.path.join(BASE_DIR, "haarcascade_frontalface_alt.xml")
@@ -19,6 +24,42 @@ trainimage_path = os.path.join(BASE_DIR, "TrainingImage")
 studentdetail_path = os.path.join(BASE_DIR, "StudentDetails", "studentdetails.csv")
 attendance_path = os.path.join(BASE_DIR, "Attendance")
 os.makedirs(attendance_path, exist_ok=True)
+
+# recognition worker threads, frame queue length and what to do when it is full
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", 0)) or max(
+    (os.cpu_count() or 2) - 1, 1
+)
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 4))
+PIPELINE_DROP_POLICY = os.environ.get(
+    "PIPELINE_DROP_POLICY", recognition_pipeline.DROP_OLDEST
+)
+# run Haar detection on one frame in DETECT_EVERY; track faces in between
+DETECT_EVERY = int(os.environ.get("DETECT_EVERY", 5))
+# recognizer distance a prediction must beat, and agreeing predictions per student
+CONFIDENCE_THRESHOLD = recognizer_backends.get_backend().threshold
+MIN_VOTES = int(os.environ.get("MIN_VOTES", 3))
+
+
+def make_face_processor(session):
+    """Pipeline worker callable recognizing frames into session (FaceSession).
+
+    The cascade and recognizer are borrowed from the process-wide registry
+    per frame, so a retrained model is picked up mid-session.
+    """
+    registry = model_registry.get_registry(
+        haarcasecade_path, trainimagelabel_path, PIPELINE_WORKERS
+    )
+    # warm one pair up front; a missing model fails here, not mid-session
+    with registry.acquire() as models:
+        if models.recognizer is None:
+            raise FileNotFoundError(trainimagelabel_path)
+
+    def process(im):
+        return session.process(im, registry)
+
+    return process
+
+
 # for choose subject and fill attendance
 def subjectChoose(text_to_speech):
     def FillAttendance():
@@ -33,9 +74,19 @@ def subjectChoose(text_to_speech):
         else:
             try:
                 Subject = sub
-                recognizer = cv2.face.LBPHFaceRecognizer_create()
                 try:
-                    recognizer.read(trainimagelabel_path)
+                    names = roster.name_index(studentdetail_path)
+                except (FileNotFoundError, ValueError) as msg:
+                    text_to_speech(str(msg))
+                    return
+                session = face_session.FaceSession(
+                    names, DETECT_EVERY, CONFIDENCE_THRESHOLD, MIN_VOTES
+                )
+                try:
+                    processors = [
+                        make_face_processor(session)
+                        for _ in range(PIPELINE_WORKERS)
+                    ]
                 except:
                     e = "Model not found,please train model"
                     Notifica.configure(
@@ -48,88 +99,56 @@ def subjectChoose(text_to_speech):
                     Notifica.place(x=20, y=250)
                     text_to_speech(e)
                     return
-                facecasCade = cv2.CascadeClassifier(haarcasecade_path)
 
-                if not os.path.exists(studentdetail_path):
-                    msg = "Student details not found. Please register a student first."
-                    text_to_speech(msg)
-                    return
-
-                df = pd.read_csv(studentdetail_path)
-                if "Enrollment" not in df.columns or "Name" not in df.columns:
-                    if df.shape[1] >= 2:
-                        df = df.iloc[:, :2]
-                        df.columns = ["Enrollment", "Name"]
-                    else:
-                        msg = "Student details file is corrupted. Please register again."
-                        text_to_speech(msg)
-                        return
-                df = df.dropna(subset=["Enrollment", "Name"])
-                try:
-                    df["Enrollment"] = df["Enrollment"].astype(int)
-                except ValueError:
-                    msg = "Enrollment IDs must be numeric. Please re-register students."
-                    text_to_speech(msg)
-                    return
                 cam = cv2.VideoCapture(0)
                 if not cam.isOpened():
                     text_to_speech("Unable to access camera.")
                     return
                 font = cv2.FONT_HERSHEY_SIMPLEX
-                col_names = ["Enrollment", "Name"]
-                attendance = pd.DataFrame(columns=col_names)
-                while True:
-                    ret, im = cam.read()
-                    if not ret:
-                        continue
-                    gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
-                    faces = facecasCade.detectMultiScale(gray, 1.2, 5)
-                    for (x, y, w, h) in faces:
-                        Id, conf = recognizer.predict(gray[y : y + h, x : x + w])
-                        if conf < 70:
-                            Subject = sub
-                            ts = time.time()
-                            date = datetime.datetime.fromtimestamp(ts).strftime(
-                                "%Y-%m-%d"
-                            )
-                            timeStamp = datetime.datetime.fromtimestamp(ts).strftime(
-                                "%H:%M:%S"
-                            )
-                            name_series = df.loc[df["Enrollment"] == Id]["Name"]
-                            if name_series.empty:
-                                name = "Unknown"
-                            else:
-                                name = str(name_series.iloc[0])
-                            captured_name = name
-                            attendance.loc[len(attendance)] = [
-                                Id,
-                                name,
-                            ]
-                            cv2.rectangle(im, (x, y), (x + w, y + h), (0, 260, 0), 4)
-                            cv2.putText(
-                                im,
-                                f"{Id}-{name}",
-                                (x + h, y),
-                                font,
-                                1,
-                                (255, 255, 0),
-                                4,
-                            )
-                        else:
-                            cv2.rectangle(im, (x, y), (x + w, y + h), (0, 25, 255), 7)
-                            cv2.putText(
-                                im, "Unknown", (x + h, y), font, 1, (0, 25, 255), 4
-                            )
-                    if time.time() > future:
-                        break
-
-                    attendance = attendance.drop_duplicates(
-                        ["Enrollment"], keep="first"
-                    )
-                    cv2.imshow("Filling Attendance...", im)
-                    key = cv2.waitKey(30) & 0xFF
-                    if key == 27:
-                        break
+                pipeline = recognition_pipeline.RecognitionPipeline(
+                    cam, processors, PIPELINE_QUEUE_SIZE, PIPELINE_DROP_POLICY
+                )
+                shown = 0
+                with pipeline:
+                    for result in pipeline.iter_results(deadline=future):
+                        if result is not None:
+                            seq, im, detections = result
+                            for (x, y, w, h, Id, conf) in detections:
+                                if Id is not None:
+                                    name = names.get(Id, "Unknown")
+                                    cv2.rectangle(
+                                        im, (x, y), (x + w, y + h), (0, 260, 0), 4
+                                    )
+                                    cv2.putText(
+                                        im,
+                                        f"{Id}-{name}",
+                                        (x + h, y),
+                                        font,
+                                        1,
+                                        (255, 255, 0),
+                                        4,
+                                    )
+                                else:
+                                    cv2.rectangle(
+                                        im, (x, y), (x + w, y + h), (0, 25, 255), 7
+                                    )
+                                    cv2.putText(
+                                        im,
+                                        "Unknown",
+                                        (x + h, y),
+                                        font,
+                                        1,
+                                        (0, 25, 255),
+                                        4,
+                                    )
+                            # workers finish out of order; never show an older frame
+                            if seq > shown:
+                                shown = seq
+                                cv2.imshow("Filling Attendance...", im)
+                        key = cv2.waitKey(1) & 0xFF
+                        if key == 27:
+                            break
+                attendance = session.attendance()
 
                 if attendance.empty:
                     cam.release()
@@ -138,19 +157,10 @@ def subjectChoose(text_to_speech):
                     text_to_speech(f)
                     return
 
-                date = datetime.datetime.now().strftime("%Y-%m-%d")
-                timeStamp = datetime.datetime.now().strftime("%H:%M:%S")
-                attendance[date] = 1
-                Hour, Minute, Second = timeStamp.split(":")
-                path = os.path.join(attendance_path, Subject)
-                os.makedirs(path, exist_ok=True)
-                fileName = os.path.join(
-                    path,
-                    f"{Subject}_{date}_{Hour}-{Minute}-{Second}.csv",
-                )
-                attendance = attendance.drop_duplicates(["Enrollment"], keep="first")
                 print(attendance)
-                attendance.to_csv(fileName, index=False)
+                fileName = session_store.write_session(
+                    attendance_path, Subject, attendance
+                )
 
                 m = "Attendance Filled Successfully of " + Subject
                 Notifica.configure(
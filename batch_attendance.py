@@ -0,0 +1,215 @@
+"""
+Headless attendance from recorded lectures.
+
+Each input (a video file or a folder of images) becomes one attendance
+session for the given subject, written in the same
+Attendance/<Subject>/<Subject>_<date>_<time>.csv format as the live mode.
+Videos are cut into frame segments and all segments of all inputs are
+processed on one process pool, so a night of recordings keeps every core
+busy. Only every --stride-th frame is decoded and recognized.
+
+Usage:
+    python batch_attendance.py --subject AI lecture1.mp4 lecture2.mp4
+    python batch_attendance.py --subject ML --stride 10 --workers 8 frames_dir/
+"""
+
+import argparse
+import datetime
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+import face_detector
+import face_preprocess
+import recognizer_backends
+import roster
+import session_store
+import vote_counter
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+haarcasecade_path = os.path.join(BASE_DIR, "haarcascade_frontalface_alt.xml")
+trainimagelabel_path = os.path.join(BASE_DIR, "TrainingImageLabel", "Trainner.yml")
+studentdetail_path = os.path.join(BASE_DIR, "StudentDetails", "studentdetails.csv")
+attendance_path = os.path.join(BASE_DIR, "Attendance")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+CONFIDENCE_THRESHOLD = recognizer_backends.get_backend().threshold
+SEGMENT_FRAMES = 1500  # about a minute of 25 fps footage per task
+
+# per-process model, loaded once by the pool initializer
+_worker = {}
+
+
+def _init_worker(cascade_path, model_path):
+    cv2.setNumThreads(1)  # parallelism comes from the pool
+    recognizer = recognizer_backends.get_backend().load(model_path)
+    _worker["detector"] = face_detector.create_detector(cascade_path)
+    _worker["recognizer"] = recognizer
+
+
+def recognize_frame(frame, detector, recognizer):
+    """Return (ids, confs) for every face detected in a BGR or gray frame."""
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    faces = face_preprocess.face_crops(
+        gray, detector.detect(gray, scale_factor=1.2, min_neighbors=5)
+    )
+    preds = recognizer_backends.predict_many(recognizer, faces)
+    return [Id for Id, _ in preds], [conf for _, conf in preds]
+
+
+def _process_video_segment(path, start, end, stride):
+    detector, recognizer = _worker["detector"], _worker["recognizer"]
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    ids = []
+    confs = []
+    frames = 0
+    for n in range(start, end):
+        # grab() skips decoding of the frames between strides
+        if not cap.grab():
+            break
+        if (n - start) % stride:
+            continue
+        ret, frame = cap.retrieve()
+        if not ret:
+            continue
+        frames += 1
+        i, c = recognize_frame(frame, detector, recognizer)
+        ids.extend(i)
+        confs.extend(c)
+    cap.release()
+    return np.array(ids, dtype=np.int64), np.array(confs), frames
+
+
+def _process_images(paths):
+    detector, recognizer = _worker["detector"], _worker["recognizer"]
+    ids = []
+    confs = []
+    frames = 0
+    for path in paths:
+        frame = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if frame is None:
+            continue
+        frames += 1
+        i, c = recognize_frame(frame, detector, recognizer)
+        ids.extend(i)
+        confs.extend(c)
+    return np.array(ids, dtype=np.int64), np.array(confs), frames
+
+
+def plan_tasks(source, stride, segment_frames=SEGMENT_FRAMES):
+    """Split one input into (function, args) tasks."""
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(source, f)
+            for f in os.listdir(source)
+            if f.lower().endswith(IMAGE_EXTENSIONS)
+        )[::stride]
+        chunk = max(segment_frames // stride, 1)
+        return [
+            (_process_images, (paths[i : i + chunk],))
+            for i in range(0, len(paths), chunk)
+        ]
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {source}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if total <= 0:
+        # unknown length (some containers): process the whole file in one task
+        return [(_process_video_segment, (source, 0, 1 << 31, stride))]
+    return [
+        (_process_video_segment, (source, s, min(s + segment_frames, total), stride))
+        for s in range(0, total, segment_frames)
+    ]
+
+
+def recording_time(source):
+    return datetime.datetime.fromtimestamp(os.path.getmtime(source))
+
+
+def run_batch(
+    sources,
+    subject,
+    stride=5,
+    workers=None,
+    min_votes=3,
+    when=None,
+    segment_frames=SEGMENT_FRAMES,
+):
+    """Process every source as one session; returns [(source, file, summary)]."""
+    names = roster.name_index(studentdetail_path)
+    workers = workers or os.cpu_count() or 1
+    votes = {
+        src: vote_counter.VoteAccumulator(
+            names, min_votes, CONFIDENCE_THRESHOLD, CONFIDENCE_THRESHOLD
+        )
+        for src in sources
+    }
+    frames = 0
+    started = time.time()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(haarcasecade_path, trainimagelabel_path),
+    ) as pool:
+        futures = {}
+        for src in sources:
+            for fn, args in plan_tasks(src, stride, segment_frames):
+                futures[pool.submit(fn, *args)] = src
+        for future in as_completed(futures):
+            ids, confs, n = future.result()
+            votes[futures[future]].add(ids, confs)
+            frames += n
+    elapsed = max(time.time() - started, 1e-6)
+    print(
+        f"{frames} frames in {elapsed:.1f}s: {frames / elapsed:.1f} frames/s, "
+        f"{frames / elapsed / workers:.1f} frames/s/core"
+    )
+
+    results = []
+    for src in sources:
+        attendance = votes[src].attendance(names)
+        fileName = None
+        if not attendance.empty:
+            fileName = session_store.write_session(
+                attendance_path, subject, attendance, when or recording_time(src)
+            )
+        results.append((src, fileName, votes[src].summary(names)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("sources", nargs="+", help="video files or image folders")
+    parser.add_argument("--subject", required=True)
+    parser.add_argument("--stride", type=int, default=5, help="use every Nth frame")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--min-votes", type=int, default=3)
+    parser.add_argument(
+        "--when",
+        help='session time "YYYY-mm-dd HH:MM:SS" (default: file modification time)',
+    )
+    args = parser.parse_args(argv)
+    when = None
+    if args.when:
+        when = datetime.datetime.strptime(args.when, "%Y-%m-%d %H:%M:%S")
+    for src, fileName, summary in run_batch(
+        args.sources,
+        args.subject,
+        max(args.stride, 1),
+        args.workers,
+        args.min_votes,
+        when,
+    ):
+        print(src)
+        print(summary)
+        print(fileName or "No Face found for attendance")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Compare face detector configurations on the same footage.
+
+    python benchmark_detectors.py lecture.mp4 --frames 300
+    python benchmark_detectors.py 0 --roi 0,200,1920,880     # camera 0
+
+Frames are decoded up front so only detection is timed. For every
+configuration it prints the median and 95th percentile time per frame,
+the frames per second one core sustains, faces per frame and how many of
+the full-resolution Haar detections it also found (IoU >= 0.3).
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+import face_detector
+from face_tracker import iou_matrix
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+haarcasecade_path = os.path.join(BASE_DIR, "haarcascade_frontalface_alt.xml")
+
+# name -> create_detector overrides; roi / mask come from the command line
+CONFIGS = {
+    "haar": {"kind": "haar", "scale": 1.0, "min_face": 0},
+    "haar-min40": {"kind": "haar", "scale": 1.0, "min_face": 40},
+    "haar-half": {"kind": "haar", "scale": 0.5, "min_face": 0},
+    "haar-half-min40": {"kind": "haar", "scale": 0.5, "min_face": 40},
+    "yunet": {"kind": "yunet", "scale": 1.0, "min_face": 0},
+    "yunet-half": {"kind": "yunet", "scale": 0.5, "min_face": 0},
+}
+
+
+def read_frames(source, limit):
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, "*")))[:limit]
+        frames = [cv2.imread(p) for p in paths]
+        return [f for f in frames if f is not None]
+    cap = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run(detector, frames):
+    times = []
+    boxes = []
+    for frame in frames:
+        start = time.perf_counter()
+        found = detector.detect(frame)
+        times.append(time.perf_counter() - start)
+        boxes.append(found)
+    return np.array(times), boxes
+
+
+def recall(found, reference):
+    total = sum(len(r) for r in reference)
+    if not total:
+        return float("nan")
+    hits = 0
+    for f, r in zip(found, reference):
+        if len(f) and len(r):
+            hits += int((iou_matrix(r, f).max(axis=1) >= 0.3).sum())
+    return hits / total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="video file, camera index or image folder")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS), choices=CONFIGS)
+    parser.add_argument("--roi", default="", help="x,y,w,h region to search")
+    parser.add_argument("--mask", default="", help="ROI mask image (white = search)")
+    args = parser.parse_args(argv)
+
+    cv2.setNumThreads(1)  # per-core numbers; the pipeline runs one per worker
+    frames = read_frames(args.source, args.frames)
+    if not frames:
+        raise SystemExit(f"No frames read from {args.source}")
+    h, w = frames[0].shape[:2]
+    print(f"{len(frames)} frames of {w}x{h}")
+    roi = face_detector.parse_roi(args.roi)
+    mask = face_detector.load_mask(args.mask)
+
+    baseline = None
+    print(f"{'config':<18}{'p50 ms':>9}{'p95 ms':>9}{'fps':>8}{'faces':>8}{'recall':>8}")
+    for name in ["haar"] + [c for c in args.configs if c != "haar"]:
+        try:
+            detector = face_detector.create_detector(
+                haarcasecade_path, roi=roi, mask=mask, **CONFIGS[name]
+            )
+        except FileNotFoundError as e:
+            print(f"{name:<18}skipped: {e}")
+            continue
+        times, boxes = run(detector, frames)
+        if baseline is None:
+            baseline = boxes
+            if name not in args.configs:
+                continue
+        ms = times * 1000
+        print(
+            f"{name:<18}{np.median(ms):>9.1f}{np.percentile(ms, 95):>9.1f}"
+            f"{1 / times.mean():>8.1f}{np.mean([len(b) for b in boxes]):>8.2f}"
+            f"{recall(boxes, baseline):>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
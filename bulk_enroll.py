@@ -0,0 +1,269 @@
+"""
+Bulk enrollment from a roster CSV and a ZIP or folder of photos.
+
+Usage:
+    python bulk_enroll.py students.csv photos.zip
+    python bulk_enroll.py students.csv photos/ --workers 8 --failures failed.csv
+
+The CSV needs Enrollment and Name columns and may have a Photo column with
+the photo's file name (or path inside the ZIP). Without it, photos are
+matched by the enrollment number their file name starts with, so
+1001.jpg, 1001_2.jpg and 1001-front.png all belong to student 1001.
+
+Photos are decoded, searched for faces and cropped on a process pool; the
+largest face of every photo is preprocessed (face_preprocess) and written
+to TrainingImage/<enrollment>_<name>/ like TakeImage does. The students
+with at least one face are then added to the roster in one locked write,
+and the model is trained once at the end.
+Students already on the roster are skipped before any image is written.
+They are reported with the rows whose enrollment or name is invalid and
+the students without a usable photo (and written to --failures).
+"""
+
+import argparse
+import csv
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import pandas as pd
+
+import attendance_db
+import face_detector
+import face_preprocess
+import roster
+import trainImage
+import training_cache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+haarcasecade_path = os.path.join(BASE_DIR, "haarcascade_frontalface_alt.xml")
+trainimage_path = os.path.join(BASE_DIR, "TrainingImage")
+trainimagelabel_path = os.path.join(BASE_DIR, "TrainingImageLabel", "Trainner.yml")
+studentdetail_path = os.path.join(BASE_DIR, "StudentDetails", "studentdetails.csv")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+LEADING_ID = re.compile(r"^(\d+)")
+
+# per-process detector and open archive, set by the pool initializer
+_worker = {}
+
+
+def _init_worker(cascade_path, archive):
+    cv2.setNumThreads(1)  # parallelism comes from the pool
+    _worker["detector"] = face_detector.create_photo_detector(cascade_path)
+    _worker["zip"] = zipfile.ZipFile(archive) if archive else None
+
+
+def list_photos(source):
+    """(archive or None, [photo names]) for a ZIP file or a directory."""
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            names = [
+                n
+                for n in zf.namelist()
+                if n.lower().endswith(IMAGE_EXTENSIONS)
+                and not os.path.basename(n).startswith(".")
+            ]
+        return source, names
+    names = []
+    for root, _, files in os.walk(source):
+        for f in files:
+            if f.lower().endswith(IMAGE_EXTENSIONS) and not f.startswith("."):
+                names.append(os.path.relpath(os.path.join(root, f), source))
+    return None, names
+
+
+def match_photos(students, names):
+    """{enrollment: [photo names]} from the Photo column or file names."""
+    photos = {}
+    if "Photo" in students.columns:
+        by_name = {}
+        for n in names:
+            by_name.setdefault(os.path.normpath(n), n)
+            by_name.setdefault(os.path.basename(n), n)
+        for enrollment, photo in zip(students["Enrollment"], students["Photo"]):
+            if isinstance(photo, str) and photo:
+                found = by_name.get(os.path.normpath(photo)) or by_name.get(
+                    os.path.basename(photo)
+                )
+                if found:
+                    photos.setdefault(enrollment, []).append(found)
+        return photos
+    for n in sorted(names):
+        m = LEADING_ID.match(os.path.basename(n))
+        if m:
+            photos.setdefault(int(m.group(1)), []).append(n)
+    return photos
+
+
+def read_photo(source, name):
+    zf = _worker["zip"]
+    if zf is not None:
+        data = np.frombuffer(zf.read(name), dtype=np.uint8)
+    else:
+        # np.fromfile + imdecode also handles non-ASCII paths on Windows
+        data = np.fromfile(os.path.join(source, name), dtype=np.uint8)
+    return cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+
+
+def extract_student(source, enrollment, name, photos, out_dir):
+    """Save the largest face of each photo; returns (enrollment, saved, error)."""
+    detector = _worker["detector"]
+    folder = os.path.join(out_dir, f"{enrollment}_{name}")
+    # number after existing images instead of overwriting them
+    first = training_cache.next_sample_number(folder) - 1
+    saved = 0
+    problems = []
+    for photo in photos:
+        try:
+            gray = read_photo(source, photo)
+        except (OSError, KeyError) as e:
+            problems.append(f"{photo}: {e}")
+            continue
+        if gray is None:
+            problems.append(f"{photo}: cannot decode")
+            continue
+        box = face_preprocess.largest_face(gray, detector)
+        if box is None:
+            problems.append(f"{photo}: no face found")
+            continue
+        face = face_preprocess.face_crop(gray, box)
+        os.makedirs(folder, exist_ok=True)
+        saved += 1
+        # same file naming as TakeImage
+        face_preprocess.save_face(
+            os.path.join(
+                folder, f"{name}_{enrollment}_{first + saved}{face_preprocess.FACE_EXT}"
+            ),
+            face,
+        )
+    error = None
+    if not saved:
+        error = "; ".join(problems) if problems else "no photo found"
+    return enrollment, saved, error
+
+
+def load_students(csv_path):
+    """(valid students, [(enrollment, name, error)] for the invalid rows)."""
+    students = pd.read_csv(
+        csv_path, dtype={"Enrollment": str, "Name": str, "Photo": str}
+    )
+    missing = {"Enrollment", "Name"} - set(students.columns)
+    if missing:
+        raise ValueError(f"{csv_path} needs columns {', '.join(sorted(missing))}")
+    raw = students["Enrollment"].fillna("").str.strip()
+    students["Name"] = students["Name"].fillna("").str.strip()
+    enrollment = pd.to_numeric(raw, errors="coerce")
+    bad_id = enrollment.isna() | (enrollment % 1 != 0)
+    bad = bad_id | (students["Name"] == "")
+    invalid = [
+        (e, n, "invalid enrollment number" if i else "missing name")
+        for e, n, i in zip(raw[bad], students["Name"][bad], bad_id[bad])
+    ]
+    students = students[~bad].copy()
+    students["Enrollment"] = enrollment[students.index].astype(int)
+    return students.drop_duplicates("Enrollment").reset_index(drop=True), invalid
+
+
+def enroll(csv_path, photo_source, workers=None, train=True, out_dir=trainimage_path):
+    """Import every student; returns (added rows, [(enrollment, name, error)]).
+
+    Raises ValueError (with a user-facing message) for a CSV without the
+    needed columns or a malformed roster, before any image is written.
+    """
+    students, invalid = load_students(csv_path)
+    archive, names = list_photos(photo_source)
+    photos = match_photos(students, names)
+    workers = workers or os.cpu_count() or 1
+    try:
+        registered = roster.name_index(studentdetail_path)
+    except FileNotFoundError:
+        registered = {}
+
+    failures = []
+    tasks = []
+    for enrollment, name in zip(students["Enrollment"], students["Name"]):
+        if enrollment in registered:
+            # their images and training data are left as they are
+            failures.append((enrollment, name, "already registered"))
+        elif enrollment in photos:
+            tasks.append((enrollment, name, photos[enrollment]))
+        else:
+            failures.append((enrollment, name, "no photo found"))
+
+    names_by_id = dict(zip(students["Enrollment"], students["Name"]))
+    enrolled = []
+    images = 0
+    started = time.time()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(haarcasecade_path, archive),
+    ) as pool:
+        results = pool.map(
+            extract_student,
+            [photo_source] * len(tasks),
+            [e for e, _, _ in tasks],
+            [n for _, n, _ in tasks],
+            [p for _, _, p in tasks],
+            [out_dir] * len(tasks),
+            chunksize=max(1, min(32, len(tasks) // (4 * workers))),
+        )
+        for enrollment, saved, error in results:
+            if error:
+                failures.append((enrollment, names_by_id[enrollment], error))
+            else:
+                enrolled.append((enrollment, names_by_id[enrollment]))
+                images += saved
+    elapsed = max(time.time() - started, 1e-6)
+    print(
+        f"{len(tasks)} students ({images} faces) in {elapsed:.1f}s: "
+        f"{len(tasks) / elapsed:.1f} students/s on {workers} workers"
+    )
+
+    # one locked write (one fsync) for the whole class
+    added = roster.add_students(studentdetail_path, enrolled)
+    db = attendance_db.get_db()
+    if db is not None and added:
+        db.upsert_students(added)
+    if len(added) < len(enrolled):
+        print(f"{len(enrolled) - len(added)} students were already on the roster")
+    if train and enrolled:
+        print(trainImage.trainModel(out_dir, trainimagelabel_path))
+    # invalid rows first, in file order (their enrollment is not a number)
+    return added, invalid + sorted(failures)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("csv", help="roster CSV with Enrollment, Name[, Photo]")
+    parser.add_argument("photos", help="ZIP archive or directory of photos")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-train", action="store_true", help="skip training")
+    parser.add_argument("--failures", help="write failed students to this CSV")
+    args = parser.parse_args(argv)
+
+    try:
+        added, failures = enroll(
+            args.csv, args.photos, args.workers, train=not args.no_train
+        )
+    except ValueError as e:
+        # malformed input CSV or roster; nothing has been written yet
+        raise SystemExit(f"bulk_enroll: {e}")
+    print(f"Enrolled {len(added)} students, {len(failures)} failed")
+    for enrollment, name, error in failures:
+        print(f"  {enrollment} {name}: {error}")
+    if args.failures and failures:
+        with open(args.failures, "w", newline="") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["Enrollment", "Name", "Error"])
+            writer.writerows(failures)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Compact, deliberately varied enrollment samples from a few captured faces.
+
+Instead of saving ~50 nearly identical webcam crops per student, enrollment
+captures CAPTURE_FRAMES faces, keeps at most KEEP_FRAMES mutually
+dissimilar ones and adds AUGMENT_VARIANTS synthetic variants of each:
+small rotation, scale and shift, horizontal flip, and a light gradient
+across the face (side lighting). With the defaults a student gets at most 24
+samples, so the LBPH model is about half the size and every predict
+compares against half as many histograms.
+
+Similarity is the Hellinger affinity of the faces' spatial LBP histograms,
+the same features LBPH matches on: two frames the recognizer cannot tell
+apart only cost model size.
+
+Every stored face is histogram-equalized (face_preprocess.normalize), and
+equalization undoes any global monotonic intensity change: gamma,
+contrast and brightness variants come out as near-copies of their source.
+The lighting variants are therefore spatial. A gradient changes pixels
+differently across the face, so it survives equalization.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+import lbph_model
+from training_cache import FACE_SIZE
+
+CAPTURE_FRAMES = int(os.environ.get("CAPTURE_FRAMES", 30))
+KEEP_FRAMES = int(os.environ.get("KEEP_FRAMES", 6))
+AUGMENT_VARIANTS = int(os.environ.get("AUGMENT_VARIANTS", 3))
+# frames at least this similar to one already kept are dropped
+DUPLICATE_SIMILARITY = float(os.environ.get("DUPLICATE_SIMILARITY", 0.97))
+
+MAX_ANGLE = 10.0  # degrees
+MAX_SCALE = 0.08
+MAX_SHIFT = 0.04  # fraction of the face size
+LIGHT_GRADIENT = 0.35  # max gain change from the face center to its edge
+
+
+def similarity(faces):
+    """(N, N) Hellinger affinity of LBP histograms; 1.0 = identical."""
+    counts, _ = lbph_model.histogram_counts(faces)
+    roots = np.sqrt(counts.astype(np.float32))
+    roots /= np.maximum(np.linalg.norm(roots, axis=1, keepdims=True), 1e-12)
+    return roots @ roots.T
+
+
+def select_diverse(faces, keep=KEEP_FRAMES, threshold=DUPLICATE_SIMILARITY):
+    """Indices of at most keep faces, each below threshold to the others.
+
+    Farthest-first: start from the first face and repeatedly add the face
+    least similar to everything kept so far, until the rest are
+    near-duplicates or keep faces are chosen.
+    """
+    if not len(faces):
+        return []
+    sim = similarity(faces)
+    chosen = [0]
+    closest = sim[0].copy()  # similarity of every face to its nearest kept one
+    while len(chosen) < keep:
+        closest[chosen] = np.inf
+        candidate = int(np.argmin(closest))
+        if closest[candidate] >= threshold:
+            break
+        chosen.append(candidate)
+        closest = np.maximum(closest, sim[candidate])
+    return sorted(chosen)
+
+
+def augment(faces, variants=AUGMENT_VARIANTS, seed=None):
+    """(N * variants, h, w) uint8 random variants of (N, h, w) faces."""
+    faces = np.asarray(faces, dtype=np.uint8)
+    n, h, w = faces.shape
+    total = n * variants
+    if not total:
+        return np.zeros((0, h, w), dtype=np.uint8)
+    rng = np.random.default_rng(seed)
+    src = np.repeat(faces, variants, axis=0)
+    angles = rng.uniform(-MAX_ANGLE, MAX_ANGLE, total)
+    scales = 1 + rng.uniform(-MAX_SCALE, MAX_SCALE, total)
+    shifts = rng.uniform(-MAX_SHIFT, MAX_SHIFT, (total, 2)) * (w, h)
+    flips = rng.random(total) < 0.5
+
+    # geometry: one warpAffine per sample (border replicated, no black wedges)
+    out = np.empty_like(src)
+    center = (w / 2, h / 2)
+    for i in range(total):
+        m = cv2.getRotationMatrix2D(center, angles[i], scales[i])
+        m[:, 2] += shifts[i]
+        cv2.warpAffine(
+            src[i], m, (w, h), dst=out[i], flags=cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_REPLICATE,
+        )
+    out[flips] = out[flips][:, :, ::-1]
+
+    # illumination: light from a random side, vectorized over the whole
+    # stack (global changes would be undone by equalization, see above)
+    theta = rng.uniform(0, 2 * np.pi, total).astype(np.float32)[:, None, None]
+    strength = rng.uniform(0, LIGHT_GRADIENT, total).astype(np.float32)[:, None, None]
+    ys, xs = np.mgrid[0:h, 0:w].astype(np.float32)
+    xs = (xs - w / 2) / (w / 2)
+    ys = (ys - h / 2) / (h / 2)
+    gain = 1 + strength * (np.cos(theta) * xs + np.sin(theta) * ys)
+    return np.clip(out * gain, 0, 255).astype(np.uint8)
+
+
+def enrollment_samples(faces, keep=KEEP_FRAMES, variants=AUGMENT_VARIANTS, seed=None):
+    """Diverse captured faces followed by their synthetic variants.
+
+    faces are grayscale crops of any size; samples are FACE_SIZE.
+    """
+    if not len(faces):
+        return np.zeros((0, FACE_SIZE[1], FACE_SIZE[0]), dtype=np.uint8)
+    faces = np.stack(
+        [cv2.resize(f, FACE_SIZE, interpolation=cv2.INTER_AREA) for f in faces]
+    )
+    kept = faces[select_diverse(faces, keep)]
+    return np.concatenate([kept, augment(kept, variants, seed)])
@@ -0,0 +1,244 @@
+"""
+Configurable face detectors.
+
+Every detector has detect(image) -> (N, 4) int array of (x, y, w, h) boxes
+in the coordinates of the full-resolution image, for a BGR or grayscale
+frame. Around the detector itself:
+
+* DETECT_SCALE < 1 runs detection on a downscaled copy and maps the boxes
+  back, so crops are still cut from the full-resolution frame;
+* DETECT_ROI ("x,y,w,h") or DETECT_ROI_MASK (an image, white = detect)
+  restricts detection to part of the frame for fixed classroom cameras;
+* DETECT_MIN_FACE / DETECT_MAX_FACE bound the face size in full-resolution
+  pixels (0 = no bound), which prunes most Haar scales.
+
+FACE_DETECTOR picks haar (the bundled cascade) or yunet
+(cv2.FaceDetectorYN, needs the ONNX file at YUNET_MODEL_PATH).
+Detector objects are not re-entrant; the model registry keeps one per
+pool slot.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FACE_DETECTOR = os.environ.get("FACE_DETECTOR", "haar")
+DETECT_SCALE = float(os.environ.get("DETECT_SCALE", 1.0))
+DETECT_MIN_FACE = int(os.environ.get("DETECT_MIN_FACE", 0))
+DETECT_MAX_FACE = int(os.environ.get("DETECT_MAX_FACE", 0))
+DETECT_ROI = os.environ.get("DETECT_ROI", "")
+DETECT_ROI_MASK = os.environ.get("DETECT_ROI_MASK", "")
+YUNET_MODEL_PATH = os.environ.get(
+    "YUNET_MODEL_PATH",
+    os.path.join(BASE_DIR, "models", "face_detection_yunet_2023mar.onnx"),
+)
+YUNET_SCORE_THRESHOLD = float(os.environ.get("YUNET_SCORE_THRESHOLD", 0.8))
+
+
+def parse_roi(text):
+    """'x,y,w,h' -> (x, y, w, h), or None for an empty string."""
+    if not text:
+        return None
+    values = [int(v) for v in text.split(",")]
+    if len(values) != 4:
+        raise ValueError(f"DETECT_ROI must be x,y,w,h, got {text!r}")
+    return tuple(values)
+
+
+def load_mask(path):
+    if not path:
+        return None
+    mask = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        raise FileNotFoundError(f"ROI mask not found: {path}")
+    return mask
+
+
+class Detector:
+    """Downscaling, ROI and size limits around a detect_raw() implementation."""
+
+    def __init__(self, scale=1.0, roi=None, mask=None, min_face=0, max_face=0):
+        self.scale = scale
+        self.roi = roi
+        self.mask = mask
+        self.min_face = min_face
+        self.max_face = max_face
+        self._regions = {}  # frame size -> detection region
+        self._masks = {}  # (frame size, region, size) -> mask for the region
+
+    def _region(self, shape):
+        h, w = shape[:2]
+        if (h, w) not in self._regions:
+            self._regions[h, w] = self._find_region(h, w)
+        return self._regions[h, w]
+
+    def _full_mask(self, h, w):
+        if self.mask.shape[:2] != (h, w):
+            return cv2.resize(self.mask, (w, h), interpolation=cv2.INTER_NEAREST)
+        return self.mask
+
+    def _find_region(self, h, w):
+        if self.roi is not None:
+            x, y, rw, rh = self.roi
+        elif self.mask is not None:
+            ys, xs = np.nonzero(self._full_mask(h, w))
+            if not len(xs):
+                return None
+            x, y = xs.min(), ys.min()
+            rw, rh = xs.max() - x + 1, ys.max() - y + 1
+        else:
+            return 0, 0, w, h
+        x0, y0 = max(int(x), 0), max(int(y), 0)
+        x1, y1 = min(int(x + rw), w), min(int(y + rh), h)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return x0, y0, x1 - x0, y1 - y0
+
+    def _scaled_mask(self, shape, region, size):
+        key = (shape[:2], region, size)
+        mask = self._masks.get(key)
+        if mask is None:
+            full = self._full_mask(*shape[:2])
+            x, y, w, h = region
+            mask = cv2.resize(
+                full[y : y + h, x : x + w], size, interpolation=cv2.INTER_NEAREST
+            )
+            self._masks[key] = mask
+        return mask
+
+    def detect(self, image, **kwargs):
+        """(N, 4) int32 boxes; kwargs tune the underlying detector call."""
+        region = self._region(image.shape)
+        if region is None:
+            return np.zeros((0, 4), dtype=np.int32)
+        x, y, w, h = region
+        view = image[y : y + h, x : x + w]
+        scale = self.scale
+        if scale != 1.0:
+            size = (max(int(round(w * scale)), 1), max(int(round(h * scale)), 1))
+            view = cv2.resize(view, size, interpolation=cv2.INTER_AREA)
+        if self.mask is not None:
+            mask = self._scaled_mask(image.shape, region, view.shape[1::-1])
+            view = cv2.bitwise_and(view, view, mask=mask)
+        min_face = int(self.min_face * scale)
+        max_face = int(self.max_face * scale)
+        boxes = np.asarray(self.detect_raw(view, min_face, max_face, **kwargs))
+        if not len(boxes):
+            return np.zeros((0, 4), dtype=np.int32)
+        boxes = np.round(boxes.reshape(-1, 4) / scale).astype(np.int32)
+        boxes[:, 0] += x
+        boxes[:, 1] += y
+        # keep crops inside the frame
+        boxes[:, 0:2] = np.maximum(boxes[:, 0:2], 0)
+        boxes[:, 2] = np.minimum(boxes[:, 2], image.shape[1] - boxes[:, 0])
+        boxes[:, 3] = np.minimum(boxes[:, 3], image.shape[0] - boxes[:, 1])
+        return boxes[(boxes[:, 2] > 0) & (boxes[:, 3] > 0)]
+
+    def detect_raw(self, image, min_face, max_face, **kwargs):
+        raise NotImplementedError
+
+
+class HaarDetector(Detector):
+    def __init__(self, cascade, scale_factor=1.2, min_neighbors=5, **kwargs):
+        super().__init__(**kwargs)
+        if isinstance(cascade, str):
+            cascade = cv2.CascadeClassifier(cascade)
+        self.cascade = cascade
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+
+    def detect_raw(
+        self, image, min_face, max_face, scale_factor=None, min_neighbors=None
+    ):
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return self.cascade.detectMultiScale(
+            gray,
+            scale_factor or self.scale_factor,
+            min_neighbors or self.min_neighbors,
+            minSize=(min_face, min_face),
+            maxSize=(max_face, max_face),
+        )
+
+
+class YuNetDetector(Detector):
+    def __init__(
+        self,
+        model_path=YUNET_MODEL_PATH,
+        score_threshold=YUNET_SCORE_THRESHOLD,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(
+                f"YuNet model not found at {model_path}; set YUNET_MODEL_PATH"
+            )
+        self.net = cv2.FaceDetectorYN.create(
+            model_path, "", (320, 320), score_threshold
+        )
+        self.input_size = None
+
+    def detect_raw(self, image, min_face, max_face, **kwargs):
+        # Haar tuning arguments (scale_factor, min_neighbors) do not apply
+        bgr = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR) if image.ndim == 2 else image
+        size = (bgr.shape[1], bgr.shape[0])
+        if size != self.input_size:
+            self.net.setInputSize(size)
+            self.input_size = size
+        _, faces = self.net.detect(bgr)
+        if faces is None:
+            return []
+        boxes = faces[:, :4]
+        side = np.maximum(boxes[:, 2], boxes[:, 3])
+        keep = np.ones(len(boxes), dtype=bool)
+        if min_face:
+            keep &= side >= min_face
+        if max_face:
+            keep &= side <= max_face
+        return boxes[keep]
+
+
+def create_detector(
+    cascade,
+    kind=None,
+    scale=None,
+    roi=None,
+    mask=None,
+    min_face=None,
+    max_face=None,
+):
+    """Detector configured from the environment; arguments override it.
+
+    cascade is the Haar cascade (path or CascadeClassifier); it is ignored
+    by yunet.
+    """
+    options = {
+        "scale": DETECT_SCALE if scale is None else scale,
+        "roi": parse_roi(DETECT_ROI) if roi is None else roi,
+        "mask": load_mask(DETECT_ROI_MASK) if mask is None else mask,
+        "min_face": DETECT_MIN_FACE if min_face is None else min_face,
+        "max_face": DETECT_MAX_FACE if max_face is None else max_face,
+    }
+    kind = (kind or FACE_DETECTOR).lower()
+    if kind == "haar":
+        return HaarDetector(cascade, **options)
+    if kind == "yunet":
+        return YuNetDetector(**options)
+    raise ValueError(f"Unknown face detector {kind!r}; choose haar or yunet")
+
+
+def create_photo_detector(cascade, kind=None):
+    """FACE_DETECTOR for enrollment and training photos.
+
+    The DETECT_* scale, region and face size settings describe the
+    classroom camera, so they are not applied: the whole photo is searched
+    for a face of any size.
+    """
+    kind = (kind or FACE_DETECTOR).lower()
+    if kind == "haar":
+        return HaarDetector(cascade)
+    if kind == "yunet":
+        return YuNetDetector()
+    raise ValueError(f"Unknown face detector {kind!r}; choose haar or yunet")
@@ -0,0 +1,171 @@
+"""
+Shared face preprocessing for capture, training and recognition.
+
+Every face the recognizer sees, whether saved at enrollment, decoded for
+training or cut from a live frame, goes through the same steps:
+
+* detect the face (training_face does this for stored images, so full
+  photos and older raw crops in TrainingImage are cropped too);
+* crop the detector box (clipped to the frame);
+* resize to FACE_SIZE;
+* level the eyes: an eye cascade runs on the upper half of the small face
+  and the face is rotated so the line between the eyes is horizontal
+  (skipped when two plausible eyes are not found, or with FACE_ALIGN=0);
+* equalize the histogram.
+
+Enrollment stores the result as a FACE_SIZE PNG (a few KB, lossless), so
+the training cache and the model only ever see fixed-size faces and every
+predict costs the same whatever the distance to the camera.
+"""
+
+import math
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from training_cache import FACE_SIZE
+
+FACE_ALIGN = os.environ.get("FACE_ALIGN", "1") != "0"
+# empty = the eye cascade bundled with opencv-python
+EYE_CASCADE_PATH = os.environ.get("EYE_CASCADE_PATH") or (
+    os.path.join(cv2.data.haarcascades, "haarcascade_eye.xml")
+    if hasattr(cv2, "data")
+    else ""
+)
+FACE_EXT = ".png"
+# photos are detected on a copy whose longest side is at most this; the
+# face is cropped from the full-resolution image
+DETECT_SIDE = 640
+# a stored image is taken as an existing face crop (older TakeImage
+# samples) when the face found fills at least CROP_FILL of its width, or
+# when no face is found in an about square image: without a margin around
+# the face the detector misses it or finds it again slightly smaller
+CROP_FILL = 0.75
+CROP_ASPECT = (0.8, 1.25)
+MAX_ALIGN_ANGLE = 25.0  # degrees; steeper eye lines are false detections
+PNG_COMPRESSION = 3
+
+# CascadeClassifier is not re-entrant: one per thread
+_local = threading.local()
+
+
+def _eye_cascade():
+    cascade = getattr(_local, "eyes", None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(EYE_CASCADE_PATH) if EYE_CASCADE_PATH else None
+        if cascade is not None and cascade.empty():
+            cascade = None
+        _local.eyes = cascade or False
+    return cascade or None
+
+
+def eye_angle(face):
+    """Tilt of the eye line in degrees for a FACE_SIZE face, or None."""
+    cascade = _eye_cascade()
+    if cascade is None:
+        return None
+    h, w = face.shape[:2]
+    side = max(w // 8, 8)
+    eyes = cascade.detectMultiScale(
+        face[: h // 2], scaleFactor=1.1, minNeighbors=4, minSize=(side, side)
+    )
+    if len(eyes) < 2:
+        return None
+    eyes = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+    (lx, ly), (rx, ry) = sorted((x + ew / 2, y + eh / 2) for x, y, ew, eh in eyes)
+    if rx - lx < w / 5:  # the same eye found twice
+        return None
+    angle = math.degrees(math.atan2(ry - ly, rx - lx))
+    return angle if abs(angle) <= MAX_ALIGN_ANGLE else None
+
+
+def align(face):
+    """face rotated about its center so the eyes are level."""
+    angle = eye_angle(face)
+    if not angle:
+        return face
+    h, w = face.shape[:2]
+    m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(
+        face, m, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE
+    )
+
+
+def normalize(face, size=FACE_SIZE):
+    """Grayscale face resized to size and histogram-equalized."""
+    if face.ndim == 3:
+        face = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+    if (face.shape[1], face.shape[0]) != tuple(size):
+        face = cv2.resize(face, size, interpolation=cv2.INTER_AREA)
+    return cv2.equalizeHist(face)
+
+
+def face_crop(gray, box, aligned=FACE_ALIGN):
+    """Preprocessed FACE_SIZE face for one (x, y, w, h) box of a gray frame."""
+    x, y, w, h = (int(v) for v in box)
+    x0, y0 = max(x, 0), max(y, 0)
+    crop = gray[y0 : y + h, x0 : x + w]
+    if not crop.size:
+        return np.zeros((FACE_SIZE[1], FACE_SIZE[0]), dtype=np.uint8)
+    face = cv2.resize(crop, FACE_SIZE, interpolation=cv2.INTER_AREA)
+    if aligned:
+        face = align(face)
+    return normalize(face)
+
+
+def face_crops(gray, boxes, aligned=FACE_ALIGN):
+    return [face_crop(gray, box, aligned) for box in boxes]
+
+
+def largest_face(gray, detector):
+    """(x, y, w, h) of the largest face in a photo, or None."""
+    scale = min(1.0, DETECT_SIDE / max(gray.shape))
+    small = gray
+    if scale < 1.0:
+        small = cv2.resize(
+            gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+        )
+    faces = detector.detect(small, scale_factor=1.1, min_neighbors=5)
+    if not len(faces):
+        return None
+    largest = max(faces, key=lambda f: f[2] * f[3])
+    return tuple((np.asarray(largest) / scale).astype(int))
+
+
+def is_preprocessed(path, image):
+    """True for a FACE_SIZE PNG written by save_face."""
+    return (
+        path.lower().endswith(FACE_EXT)
+        and (image.shape[1], image.shape[0]) == tuple(FACE_SIZE)
+    )
+
+
+def training_face(gray, detector, preprocessed=False):
+    """Preprocessed face of a stored training image, or None to skip it.
+
+    Faces saved by save_face are only normalized again. Anything else goes
+    through the same detection, crop and alignment as a live frame.
+    """
+    if preprocessed:
+        return normalize(gray)
+    h, w = gray.shape[:2]
+    box = largest_face(gray, detector)
+    if box is None:
+        if not CROP_ASPECT[0] <= w / h <= CROP_ASPECT[1]:
+            return None
+        box = (0, 0, w, h)
+    elif box[2] >= CROP_FILL * w:
+        box = (0, 0, w, h)
+    return face_crop(gray, box)
+
+
+def save_face(path, face):
+    """Write a preprocessed face as PNG; tofile handles non-ASCII paths."""
+    ok, buf = cv2.imencode(
+        FACE_EXT, face, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+    )
+    if not ok:
+        raise OSError(f"cannot encode face for {path}")
+    buf.tofile(path)
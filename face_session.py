@@ -0,0 +1,64 @@
+"""
+Per-frame face recognition for one attendance session.
+
+FaceSession bundles the IoU tracker and vote accumulator of one camera and
+recognizes a frame with a (detector, recognizer) pair borrowed from the
+model registry. It is shared by the Tk attendance window, the multi-room
+server and anything else that turns frames into attendance.
+"""
+
+import cv2
+
+import face_preprocess
+import face_tracker
+import vote_counter
+from recognizer_backends import predict_many
+
+
+class FaceSession:
+    """Tracker + votes of one session; process() is safe from many threads."""
+
+    def __init__(self, names, detect_every=5, threshold=70, min_votes=3):
+        self.names = names
+        self.tracker = face_tracker.FaceTracker(
+            detect_every, max_conf=threshold, min_votes=min_votes
+        )
+        self.votes = vote_counter.VoteAccumulator(
+            names, min_votes, threshold, threshold
+        )
+
+    def recognize(self, im, detector, recognizer):
+        """Detect faces in a BGR frame and predict the unconfirmed tracks."""
+        gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY) if im.ndim == 3 else im
+        faces = detector.detect(gray, scale_factor=1.2, min_neighbors=5)
+        tracks = self.tracker.update(faces)
+        pending = [track for track in tracks if not track.confirmed]
+        # same aligned, equalized FACE_SIZE faces the model was trained on
+        crops = face_preprocess.face_crops(gray, [track.box for track in pending])
+        # all faces of the frame are matched in one batched call
+        preds = predict_many(recognizer, crops)
+        for track, (Id, conf) in zip(pending, preds):
+            self.tracker.observe(track, Id, conf)
+        if preds:
+            self.votes.add([Id for Id, _ in preds], [conf for _, conf in preds])
+        return tracks
+
+    def process(self, im, registry):
+        """(x, y, w, h, enrollment or None while unconfirmed, confidence) list.
+
+        Detection runs only when the tracker asks for it; the detector and
+        recognizer are borrowed from registry for that frame only, so a
+        retrained model is picked up mid-session.
+        """
+        if not self.tracker.should_detect():
+            tracks = self.tracker.active()
+        else:
+            with registry.acquire() as models:
+                tracks = self.recognize(im, models.detector, models.recognizer)
+        return [(*t.box, t.label, t.conf) for t in tracks if t.conf is not None]
+
+    def attendance(self):
+        return self.votes.attendance(self.names)
+
+    def summary(self):
+        return self.votes.summary(self.names)
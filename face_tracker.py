@@ -0,0 +1,131 @@
+"""
+IoU tracking of detected faces across frames.
+
+Haar detection runs only on every Nth frame; in between the last known
+boxes are reused. Each track keeps the enrollment it was confirmed as, so
+the LBPH recognizer only runs on tracks that have no confirmed identity yet.
+Students sitting still therefore cost one prediction per session instead
+of one per frame.
+"""
+
+import itertools
+import threading
+
+import numpy as np
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box  # (x, y, w, h)
+        self.label = None  # confirmed enrollment
+        self.last_id = None  # most recent prediction, confirmed or not
+        self.conf = None
+        self.missed = 0
+        self.votes = {}  # Id -> [agreeing predictions, summed distance]
+
+    @property
+    def confirmed(self):
+        return self.label is not None
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU between (n, 4) and (m, 4) arrays of x, y, w, h boxes."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    iw = np.minimum(ax2[:, None], bx2[None, :]) - np.maximum(a[:, 0, None], b[:, 0])
+    ih = np.minimum(ay2[:, None], by2[None, :]) - np.maximum(a[:, 1, None], b[:, 1])
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    area_a = (a[:, 2] * a[:, 3])[:, None]
+    area_b = (b[:, 2] * b[:, 3])[None, :]
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+class FaceTracker:
+    """Thread-safe tracker shared by all recognition workers of a session.
+
+    detect_every: run the detector on one frame out of this many.
+    max_missed: detection passes a track may go unmatched before it is dropped.
+    max_conf: LBPH distance below which a prediction counts as a vote.
+    min_votes: agreeing votes needed to confirm a track's enrollment.
+    """
+
+    def __init__(
+        self,
+        detect_every=5,
+        iou_threshold=0.3,
+        max_missed=3,
+        max_conf=70,
+        min_votes=3,
+    ):
+        self.detect_every = max(int(detect_every), 1)
+        self.min_votes = max(int(min_votes), 1)
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.max_conf = max_conf
+        self.tracks = []
+        self.lock = threading.Lock()
+        self._frames = itertools.count()
+        self._ids = itertools.count(1)
+
+    def should_detect(self):
+        """True on every detect_every-th call (and on the very first)."""
+        with self.lock:
+            return next(self._frames) % self.detect_every == 0 or not self.tracks
+
+    def update(self, boxes):
+        """Associate detected boxes with tracks; returns the matching tracks."""
+        boxes = [tuple(int(v) for v in box) for box in boxes]
+        with self.lock:
+            matched = [None] * len(boxes)
+            if self.tracks and boxes:
+                iou = iou_matrix([t.box for t in self.tracks], boxes)
+                used = set()
+                # greedy assignment, best overlaps first
+                for flat in np.argsort(iou, axis=None)[::-1]:
+                    ti, bi = np.unravel_index(flat, iou.shape)
+                    if iou[ti, bi] < self.iou_threshold:
+                        break
+                    if matched[bi] is not None or ti in used:
+                        continue
+                    matched[bi] = self.tracks[ti]
+                    used.add(ti)
+            seen = set()
+            for bi, track in enumerate(matched):
+                if track is None:
+                    track = Track(next(self._ids), boxes[bi])
+                    self.tracks.append(track)
+                    matched[bi] = track
+                track.box = boxes[bi]
+                track.missed = 0
+                seen.add(track.track_id)
+            for track in self.tracks:
+                if track.track_id not in seen:
+                    track.missed += 1
+            self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+            return matched
+
+    def observe(self, track, Id, conf):
+        """Record a recognizer prediction for an unconfirmed track.
+
+        The track is confirmed once min_votes predictions below max_conf
+        agree on the same enrollment.
+        """
+        with self.lock:
+            track.last_id = Id
+            track.conf = conf
+            if conf >= self.max_conf:
+                return
+            vote = track.votes.setdefault(Id, [0, 0.0])
+            vote[0] += 1
+            vote[1] += conf
+            if vote[0] >= self.min_votes:
+                track.label = Id
+                track.conf = vote[1] / vote[0]
+
+    def active(self):
+        """Tracks seen on the latest detection pass."""
+        with self.lock:
+            return [t for t in self.tracks if t.missed == 0]
@@ -0,0 +1,73 @@
+"""
+Process-wide LRU cache for values derived from files.
+
+Entries are keyed on the call arguments and validated against the
+(mtime, size) of the files they were built from, so Streamlit reruns and
+concurrent sessions share one parse per change of the underlying files.
+Cached values are shared: callers must not mutate them.
+"""
+
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+
+def file_stamp(path):
+    """(mtime_ns, size) of path, or None when it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class FileCache:
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # key -> (stamp, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, paths, loader):
+        # stamp before loading: a file changed mid-load is reloaded next time
+        stamp = tuple(file_stamp(p) for p in paths)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader()
+        with self.lock:
+            self.entries[key] = (stamp, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def cached_on_files(paths, maxsize=32):
+    """Decorator caching func(*args) until any file in paths(*args) changes.
+
+    Directories work too: their mtime changes when entries are added or
+    removed.
+    """
+
+    def decorator(func):
+        cache = FileCache(maxsize)
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            return cache.get_or_load(args, paths(*args), lambda: func(*args))
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
@@ -0,0 +1,189 @@
+"""
+Frame ingestion in front of the recognizer: micro-batches and backpressure.
+
+Callers submit() one frame and get a concurrent.futures.Future. Worker
+threads take up to BATCH_MAX queued frames at a time, waiting at most
+BATCH_WAIT_MS after the oldest one arrived for a batch to fill, and hand
+the whole batch to process_batch(items) -> results in one call.
+
+The queue is bounded: submit() raises Overloaded once INGEST_QUEUE_MAX
+frames are waiting, and frames that waited longer than INGEST_MAX_WAIT_MS
+are shed with Overloaded instead of being processed late. Callers turn
+that into an HTTP 429 / "try again" so a burst costs a retry, not memory
+and ever-growing latency. metrics() reports queue depth, shedding and
+latency percentiles.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+BATCH_MAX = int(os.environ.get("BATCH_MAX", 16))
+BATCH_WAIT_MS = float(os.environ.get("BATCH_WAIT_MS", 15))
+INGEST_QUEUE_MAX = int(os.environ.get("INGEST_QUEUE_MAX", 64))
+INGEST_MAX_WAIT_MS = float(os.environ.get("INGEST_MAX_WAIT_MS", 2000))
+LATENCY_WINDOW = 1000  # recent requests kept for the percentiles
+
+
+class Overloaded(Exception):
+    """The frame was not accepted or was shed; retry after retry_after s."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FrameIngest:
+    def __init__(
+        self,
+        process_batch,
+        workers=1,
+        batch_max=BATCH_MAX,
+        batch_wait=BATCH_WAIT_MS / 1000.0,
+        queue_max=INGEST_QUEUE_MAX,
+        max_wait=INGEST_MAX_WAIT_MS / 1000.0,
+    ):
+        self.process_batch = process_batch
+        self.workers = max(int(workers), 1)
+        self.batch_max = max(int(batch_max), 1)
+        self.batch_wait = batch_wait
+        self.queue_max = max(int(queue_max), 1)
+        self.max_wait = max_wait
+        self.cond = threading.Condition()
+        self.queue = deque()  # (submitted at, item, future)
+        self.closed = False
+        self.max_depth = 0
+        self.submitted = 0
+        self.processed = 0
+        self.rejected = 0  # queue full at submit
+        self.expired = 0  # waited longer than max_wait
+        self.failed = 0
+        self.batches = 0
+        self.frame_seconds = 0.0  # processing time per frame, smoothed
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.threads = [
+            threading.Thread(target=self._work, daemon=True)
+            for _ in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def retry_after(self, depth):
+        """Seconds until a queue of depth frames should have drained."""
+        per_frame = self.frame_seconds or self.batch_wait
+        return max(1, math.ceil(depth * per_frame / self.workers))
+
+    def submit(self, item):
+        future = Future()
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("frame ingest is closed")
+            depth = len(self.queue)
+            if depth >= self.queue_max:
+                self.rejected += 1
+                raise Overloaded(f"{depth} frames queued", self.retry_after(depth))
+            self.queue.append((time.monotonic(), item, future))
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, depth + 1)
+            self.cond.notify()
+        return future
+
+    def _shed_expired(self, now):
+        while self.queue and now - self.queue[0][0] > self.max_wait:
+            _, _, future = self.queue.popleft()
+            self.expired += 1
+            if future.set_running_or_notify_cancel():
+                future.set_exception(
+                    Overloaded("frame waited too long", self.retry_after(len(self.queue)))
+                )
+
+    def _take_batch(self):
+        with self.cond:
+            while True:
+                if self.closed and not self.queue:
+                    return None
+                self._shed_expired(time.monotonic())
+                if not self.queue:
+                    self.cond.wait()
+                    continue
+                # a full batch goes now; otherwise wait for the oldest
+                # frame's batch_wait to run out
+                remaining = self.queue[0][0] + self.batch_wait - time.monotonic()
+                if len(self.queue) >= self.batch_max or remaining <= 0 or self.closed:
+                    n = min(len(self.queue), self.batch_max)
+                    return [self.queue.popleft() for _ in range(n)]
+                self.cond.wait(remaining)
+
+    def _work(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            # callers may have given up (cancelled) while the frame was queued
+            batch = [entry for entry in batch if entry[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            start = time.monotonic()
+            try:
+                results = self.process_batch([item for _, item, _ in batch])
+            except Exception as err:
+                with self.cond:
+                    self.failed += len(batch)
+                for _, _, future in batch:
+                    future.set_exception(err)
+                continue
+            end = time.monotonic()
+            with self.cond:
+                self.batches += 1
+                self.processed += len(batch)
+                per_frame = (end - start) / len(batch)
+                self.frame_seconds = (
+                    per_frame
+                    if not self.frame_seconds
+                    else 0.8 * self.frame_seconds + 0.2 * per_frame
+                )
+                self.latencies.extend(end - submitted for submitted, _, _ in batch)
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def depth(self):
+        with self.cond:
+            return len(self.queue)
+
+    def metrics(self):
+        with self.cond:
+            latencies = np.array(self.latencies) * 1000
+            metrics = {
+                "queue_depth": len(self.queue),
+                "queue_max": self.queue_max,
+                "max_depth": self.max_depth,
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "failed": self.failed,
+                "batches": self.batches,
+                "mean_batch": 0,
+                "latency_p50_ms": None,
+                "latency_p99_ms": None,
+            }
+            if self.batches:
+                metrics["mean_batch"] = round(self.processed / self.batches, 2)
+            if len(latencies):
+                p50, p99 = np.percentile(latencies, [50, 99])
+                metrics["latency_p50_ms"] = round(float(p50), 1)
+                metrics["latency_p99_ms"] = round(float(p99), 1)
+            return metrics
+
+    def close(self):
+        """Stop accepting frames; workers finish what is queued and exit."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
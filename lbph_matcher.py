@@ -0,0 +1,230 @@
+"""
+Batched nearest-neighbour matcher over a compact LBPH model.
+
+OpenCV's predict scans every stored histogram with a chi-square distance,
+once per face. LBPHMatcher keeps all training histograms in one contiguous
+count matrix and answers every face of a frame in one call:
+
+* a shortlist pass scores all queries against all rows with one matrix
+  product: the Hellinger affinity (dot product of square-rooted histograms)
+  of histograms pooled COARSE_POOL bins at a time, which ranks rows close
+  to the chi-square order;
+* the exact chi-square distance, as OpenCV computes it, is then taken for
+  the top_k shortlisted rows only, touching just the query's non-zero bins.
+
+top_k = 0 (the default) skips the shortlist and scans every row exactly,
+giving OpenCV's nearest neighbour; MATCH_TOP_K > 0 opts into the faster,
+approximate shortlist. Optionally each student is reduced to a few
+prototype histograms (k-medoids under the chi-square distance), computed
+at training time and saved next to the model as Trainner.p<k>.npz.
+"""
+
+import os
+
+import numpy as np
+
+import lbph_model
+
+# prototype histograms kept per student (0 = use every training image)
+MATCH_PROTOTYPES = int(os.environ.get("MATCH_PROTOTYPES", 0))
+# shortlisted rows compared exactly per face; approximate, so opt-in
+# (0 = exact scan of every row, same result as OpenCV)
+MATCH_TOP_K = int(os.environ.get("MATCH_TOP_K", 0))
+COARSE_POOL = 16  # neighbouring LBP bins summed into one shortlist bin
+
+
+def prototype_path(model_path, k):
+    """Trainner.yml -> Trainner.p5.npz"""
+    return os.path.splitext(model_path)[0] + f".p{k}" + lbph_model.COMPACT_EXT
+
+
+def _shortlist_vectors(counts):
+    """Unit-length square roots of pooled histograms (Hellinger affinity)."""
+    counts = np.asarray(counts)
+    pooled = counts.reshape(len(counts), -1, COARSE_POOL).sum(axis=2, dtype=np.float32)
+    roots = np.sqrt(pooled)
+    norms = np.linalg.norm(roots, axis=1, keepdims=True)
+    return roots / np.maximum(norms, np.float32(1e-12))
+
+
+def pairwise_chi_square(a, b):
+    """(len(a), len(b)) chi-square distances between two histogram stacks."""
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    sums_b = b.sum(axis=1, dtype=np.float64)
+    out = np.empty((len(a), len(b)), dtype=np.float64)
+    for i, row in enumerate(a):
+        # same non-zero-bin form as LBPHMatcher._exact
+        nz = np.flatnonzero(row)
+        x = b[:, nz]
+        q = row[nz]
+        cross = (x * q / (x + q)).sum(axis=1, dtype=np.float64)
+        out[i] = 2 * (sums_b + row.sum(dtype=np.float64) - 4 * cross)
+    return out
+
+
+def k_medoids(dist, k, iters=20):
+    """Indices of k medoids for a square distance matrix (alternating updates)."""
+    n = len(dist)
+    if n <= k:
+        return np.arange(n)
+    # deterministic start: the most central point, then farthest-first
+    medoids = [int(np.argmin(dist.sum(axis=1)))]
+    while len(medoids) < k:
+        medoids.append(int(np.argmax(dist[:, medoids].min(axis=1))))
+    medoids = np.array(medoids)
+    for _ in range(iters):
+        assign = np.argmin(dist[:, medoids], axis=1)
+        updated = medoids.copy()
+        for c in range(k):
+            members = np.flatnonzero(assign == c)
+            if len(members):
+                within = dist[np.ix_(members, members)].sum(axis=1)
+                updated[c] = members[np.argmin(within)]
+        if np.array_equal(np.sort(updated), np.sort(medoids)):
+            break
+        medoids = updated
+    return np.sort(medoids)
+
+
+def reduce_prototypes(model, k, base=None, changed=None):
+    """Model keeping k medoid histograms per label.
+
+    With base (an earlier prototype model) only the labels in changed are
+    recomputed; the others are copied from base.
+    """
+    labels = model.labels
+    hists = model.histograms
+    keep = []
+    reused = []
+    for label in np.unique(labels):
+        if base is not None and changed is not None and label not in changed:
+            rows = np.flatnonzero(base.labels == label)
+            if len(rows):
+                reused.append(rows)
+                continue
+        rows = np.flatnonzero(labels == label)
+        dist = pairwise_chi_square(hists[rows], hists[rows])
+        keep.append(rows[k_medoids(dist, k)])
+    parts = []
+    part_labels = []
+    if keep:
+        rows = np.concatenate(keep)
+        parts.append(np.asarray(model.counts)[rows])
+        part_labels.append(labels[rows])
+    if reused:
+        rows = np.concatenate(reused)
+        parts.append(np.asarray(base.counts)[rows])
+        part_labels.append(base.labels[rows])
+    reduced = lbph_model.LBPHModel(
+        np.concatenate(parts), np.concatenate(part_labels), model.cell
+    )
+    reduced.face_size = model.face_size
+    return reduced
+
+
+class LBPHMatcher:
+    """predict / predict_batch over an LBPHModel, with top-k shortlisting.
+
+    Distances are computed on the integer bin counts (chi-square scales
+    linearly with them) and divided by the cell size at the end, so the
+    model's uint8 count matrix is used as is, memory-mapped or not.
+    """
+
+    def __init__(self, model, top_k=MATCH_TOP_K):
+        self.model = model
+        self.labels = model.labels
+        self.cell = model.cell
+        self.top_k = top_k
+        self.counts = np.ascontiguousarray(model.counts)
+        self.sums = model.row_sums()
+        self.shortlist = _shortlist_vectors(self.counts) if top_k else None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _exact(self, rows, query, nz):
+        """Chi-square of query against counts[rows] using only its non-zero bins.
+
+        sum (a-q)^2/(a+q) = sum a + sum q - 4 * sum_{q>0} a q / (a + q)
+        """
+        if rows is None:
+            a, sums = self.counts[:, nz], self.sums
+        else:
+            a, sums = self.counts[np.ix_(rows, nz)], self.sums[rows]
+        a = a.astype(np.float32)
+        q = query[nz]
+        cross = (a * q / (a + q)).sum(axis=1, dtype=np.float64)
+        return 2 * (sums + query.sum(dtype=np.float64) - 4 * cross)
+
+    def candidates(self, queries):
+        """(M, top_k) rows with the highest shortlist affinity per query."""
+        scores = _shortlist_vectors(queries) @ self.shortlist.T
+        k = min(self.top_k, scores.shape[1])
+        if k == scores.shape[1]:
+            return np.tile(np.arange(k), (len(queries), 1))
+        return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+    def nearest(self, queries):
+        """(rows, count-scale distances) of the nearest row for each query.
+
+        queries are histograms scaled to counts (normalised histogram * cell).
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        rows = np.zeros(len(queries), dtype=np.int64)
+        dists = np.full(len(queries), np.inf)
+        if not len(self.counts) or not len(queries):
+            return rows, dists
+        shortlist = self.candidates(queries) if self.top_k else None
+        for m, query in enumerate(queries):
+            block = None if shortlist is None else shortlist[m]
+            d = self._exact(block, query, np.flatnonzero(query))
+            best = int(np.argmin(d))
+            rows[m] = best if block is None else block[best]
+            dists[m] = d[best]
+        return rows, dists
+
+    def predict_batch(self, faces):
+        """[(label, distance)] for a list of grayscale faces, one LBP pass."""
+        if not len(faces):
+            return []
+        if not len(self.labels):
+            return [(-1, float("inf"))] * len(faces)
+        queries = lbph_model.histograms(np.stack(faces)) * np.float32(self.cell)
+        rows, dists = self.nearest(queries)
+        return [
+            (int(self.labels[r]), float(d) / self.cell) for r, d in zip(rows, dists)
+        ]
+
+    def predict(self, face):
+        return self.predict_batch([face])[0]
+
+
+def save_prototypes(model, model_path, k, changed=None):
+    """Write Trainner.p<k>.npz for model, reusing unchanged labels if possible."""
+    path = prototype_path(model_path, k)
+    base = None
+    if changed is not None and os.path.isfile(path):
+        base = lbph_model.load(path)
+    lbph_model.save(reduce_prototypes(model, k, base, changed), path)
+    return path
+
+
+def load_recognizer(model_path, prototypes=MATCH_PROTOTYPES, top_k=MATCH_TOP_K):
+    """LBPHMatcher for the model at model_path (.npz, or converted from .yml).
+
+    With prototypes > 0 the prototype model is used when it is at least as
+    new as the full model.
+    """
+    model = lbph_model.load_recognizer(model_path)
+    if not isinstance(model, lbph_model.LBPHModel):
+        model = lbph_model.from_recognizer(model)
+    if prototypes:
+        path = prototype_path(model_path, prototypes)
+        full = lbph_model.compact_path(model_path)
+        if os.path.isfile(path) and (
+            not os.path.isfile(full)
+            or os.stat(path).st_mtime_ns >= os.stat(full).st_mtime_ns
+        ):
+            model = lbph_model.load(path)
+    return LBPHMatcher(model, top_k)
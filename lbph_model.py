@@ -0,0 +1,314 @@
+"""
+Compact LBPH model.
+
+OpenCV's LBPHFaceRecognizer keeps one spatial LBP histogram per training
+image and saves them as text YAML, which for a full roster is hundreds of
+MB and takes seconds to parse. This module computes the same histograms
+(radius 1, 8 neighbours, 8x8 grid) with NumPy and stores them as one
+integer count matrix plus labels in an uncompressed .npz, whose members
+are memory-mapped on load. LBPHModel.predict matches OpenCV's predict
+(chi-square distance, nearest histogram), so it can stand in for the
+OpenCV object.
+
+    python lbph_model.py TrainingImageLabel/Trainner.yml   # convert a model
+"""
+
+import argparse
+import json
+import os
+import zipfile
+
+import cv2
+import numpy as np
+
+RADIUS = 1
+NEIGHBORS = 8
+GRID = (8, 8)  # (grid_x, grid_y)
+BINS = 1 << NEIGHBORS
+COMPACT_EXT = ".npz"
+TRAIN_CHUNK = 1024  # faces per histogram batch
+LBP_CHUNK = 32  # faces per float32 LBP pass
+
+
+def compact_path(model_path):
+    """Trainner.yml -> Trainner.npz"""
+    return os.path.splitext(model_path)[0] + COMPACT_EXT
+
+
+def _offsets():
+    # same sampling points and bilinear weights as OpenCV's elbp()
+    points = []
+    for n in range(NEIGHBORS):
+        x = np.float32(RADIUS * np.cos(2.0 * np.pi * n / NEIGHBORS))
+        y = np.float32(-RADIUS * np.sin(2.0 * np.pi * n / NEIGHBORS))
+        fx, fy = int(np.floor(x)), int(np.floor(y))
+        cx, cy = int(np.ceil(x)), int(np.ceil(y))
+        tx, ty = np.float32(x - fx), np.float32(y - fy)
+        weights = (
+            np.float32((1 - tx) * (1 - ty)),
+            np.float32(tx * (1 - ty)),
+            np.float32((1 - tx) * ty),
+            np.float32(tx * ty),
+        )
+        points.append(((fy, fx), (fy, cx), (cy, fx), (cy, cx), weights))
+    return points
+
+
+_POINTS = _offsets()
+
+
+def lbp_images(faces, chunk=LBP_CHUNK):
+    """Extended LBP codes of an (N, H, W) uint8 stack -> (N, H-2r, W-2r) uint8."""
+    faces = np.asarray(faces)
+    n, h, w = faces.shape
+    r = RADIUS
+    codes = np.zeros((n, h - 2 * r, w - 2 * r), dtype=np.uint8)
+    eps = np.finfo(np.float32).eps
+    # small batches keep the float32 temporaries in cache
+    for i in range(0, n, chunk):
+        src = faces[i : i + chunk].astype(np.float32)
+        center = src[:, r : h - r, r : w - r]
+        out = codes[i : i + chunk]
+        for bit, (*corners, weights) in enumerate(_POINTS):
+            t = None
+            for (dy, dx), wt in zip(corners, weights):
+                if wt < 1e-6:
+                    continue  # adds nothing to a float32 sum of pixel values
+                term = wt * src[:, r + dy : h - r + dy, r + dx : w - r + dx]
+                t = term if t is None else np.add(t, term, out=t)
+            hit = np.abs(t - center) < eps
+            hit |= t > center
+            out |= hit.view(np.uint8) << bit
+    return codes
+
+
+def histogram_counts(faces):
+    """Un-normalised spatial LBP histograms -> ((N, cells * BINS) counts, cell size).
+
+    Dividing the counts by the cell size gives exactly the float histograms
+    OpenCV stores; all faces must have the same size.
+    """
+    codes = lbp_images(faces)
+    n, h, w = codes.shape
+    gx, gy = GRID
+    ch, cw = h // gy, w // gx
+    # OpenCV ignores the pixels past the last full cell
+    cells = codes[:, : gy * ch, : gx * cw].reshape(n, gy, ch, gx, cw)
+    cells = cells.transpose(0, 1, 3, 2, 4).reshape(n, gy * gx, ch * cw)
+    offsets = (np.arange(n * gy * gx, dtype=np.int64) * BINS)[:, None]
+    counts = np.bincount(
+        (cells + offsets.reshape(n, gy * gx, 1)).ravel(),
+        minlength=n * gy * gx * BINS,
+    )
+    counts = counts.reshape(n, gy * gx * BINS)
+    dtype = np.uint8 if ch * cw <= np.iinfo(np.uint8).max else np.uint16
+    return counts.astype(dtype), ch * cw
+
+
+def histograms(faces):
+    """Normalised float32 histograms, as LBPHFaceRecognizer.getHistograms()."""
+    counts, cell = histogram_counts(faces)
+    return counts.astype(np.float32) / np.float32(cell)
+
+
+def chi_square(hists, query):
+    """OpenCV HISTCMP_CHISQR_ALT between each row of hists and query."""
+    hists = np.asarray(hists, dtype=np.float64)
+    query = np.asarray(query, dtype=np.float64)
+    a = hists - query
+    b = hists + query
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(b > np.finfo(np.float64).eps, a * a / b, 0)
+    return 2 * terms.sum(axis=-1)
+
+
+class LBPHModel:
+    """Read-only LBPH model: histograms as counts / cell plus int32 labels."""
+
+    def __init__(self, counts, labels, cell):
+        self.counts = counts
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.cell = cell
+        self.face_size = None  # (width, height) of training faces, if known
+        self.sums = None  # float64 total count per row, saved with the model
+
+    def row_sums(self):
+        if self.sums is None:
+            self.sums = np.asarray(self.counts).sum(axis=1, dtype=np.float64)
+        return self.sums
+
+    @property
+    def histograms(self):
+        return np.asarray(self.counts, dtype=np.float32) / np.float32(self.cell)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def query_histogram(self, face):
+        return histograms(np.asarray(face)[None])[0]
+
+    def predict(self, face):
+        """(label, distance) of the nearest training histogram, like OpenCV."""
+        if not len(self.labels):
+            return -1, float("inf")
+        dist = chi_square(self.histograms, self.query_histogram(face))
+        best = int(np.argmin(dist))
+        return int(self.labels[best]), float(dist[best])
+
+    def extend(self, faces, labels):
+        """New model with the histograms of more training faces appended."""
+        added = train(faces, labels)
+        if added.cell != self.cell:
+            raise ValueError("Faces differ in size from the model's training faces")
+        model = LBPHModel(
+            np.concatenate([np.asarray(self.counts), added.counts]),
+            np.concatenate([self.labels, added.labels]),
+            self.cell,
+        )
+        model.face_size = self.face_size or added.face_size
+        model.sums = np.concatenate([self.row_sums(), added.row_sums()])
+        return model
+
+
+def train(faces, labels, chunk=TRAIN_CHUNK):
+    """Compact model of an (N, H, W) face stack, built chunk by chunk."""
+    faces = np.asarray(faces)
+    parts = [histogram_counts(faces[i : i + chunk]) for i in range(0, len(faces), chunk)]
+    counts = np.concatenate([c for c, _ in parts])
+    model = LBPHModel(counts, labels, parts[0][1])
+    model.face_size = (faces.shape[2], faces.shape[1])
+    return model
+
+
+def save(model, path):
+    """Write an uncompressed .npz atomically (members stay memory-mappable)."""
+    meta = {
+        "radius": RADIUS,
+        "neighbors": NEIGHBORS,
+        "grid": list(GRID),
+        "cell": model.cell,
+        "face_size": list(model.face_size) if model.face_size else None,
+    }
+    tmp = os.path.splitext(path)[0] + ".tmp" + COMPACT_EXT
+    with open(tmp, "wb") as fh:
+        np.savez(
+            fh,
+            counts=np.asarray(model.counts),
+            labels=model.labels,
+            sums=np.asarray(model.row_sums()),
+            meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8),
+        )
+    os.replace(tmp, path)
+
+
+def mmap_member(path, zf, name):
+    """Memory-map one stored (uncompressed) .npy member of an .npz."""
+    info = zf.getinfo(name + ".npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        return np.load(zf.open(info))
+    with open(path, "rb") as fh:
+        fh.seek(info.header_offset)
+        local = fh.read(30)
+        name_len = int.from_bytes(local[26:28], "little")
+        extra_len = int.from_bytes(local[28:30], "little")
+        fh.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(fh)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(fh)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(fh)
+        offset = fh.tell()
+    if not shape or 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(
+        path, dtype=dtype, mode="r", offset=offset, shape=shape,
+        order="F" if fortran else "C",
+    )
+
+
+def load(path):
+    with zipfile.ZipFile(path) as zf:
+        meta = json.loads(bytes(np.load(zf.open("meta.npy"))).decode())
+        counts = mmap_member(path, zf, "counts")
+        labels = np.load(zf.open("labels.npy"))
+        # models saved before the row sums were stored compute them on demand
+        sums = mmap_member(path, zf, "sums") if "sums.npy" in zf.namelist() else None
+    if (meta["radius"], meta["neighbors"], tuple(meta["grid"])) != (
+        RADIUS,
+        NEIGHBORS,
+        GRID,
+    ):
+        raise ValueError(f"Unsupported LBPH parameters in {path}")
+    model = LBPHModel(counts, labels, meta["cell"])
+    model.sums = sums
+    if meta.get("face_size"):
+        model.face_size = tuple(meta["face_size"])
+    return model
+
+
+def from_recognizer(recognizer, cell=None):
+    """Compact model from a trained OpenCV LBPHFaceRecognizer."""
+    if (recognizer.getRadius(), recognizer.getNeighbors()) != (RADIUS, NEIGHBORS) or (
+        recognizer.getGridX(),
+        recognizer.getGridY(),
+    ) != GRID:
+        raise ValueError("Only radius 1, 8 neighbours, 8x8 grid models are supported")
+    hists = np.vstack([np.asarray(h).reshape(1, -1) for h in recognizer.getHistograms()])
+    labels = np.asarray(recognizer.getLabels()).ravel()
+    if cell is None:
+        # smallest positive bin value is 1 / cell for count histograms
+        positive = hists[hists > 0]
+        cell = int(round(1.0 / positive.min())) if positive.size else 1
+    counts = np.rint(hists * cell)
+    if np.abs(counts / cell - hists).max(initial=0) > 1e-6:
+        raise ValueError("Histograms are not whole counts over a common cell size")
+    dtype = np.uint8 if counts.max(initial=0) <= np.iinfo(np.uint8).max else np.uint16
+    return LBPHModel(counts.astype(dtype), labels, cell)
+
+
+def convert(model_path, out_path=None):
+    """Trainner.yml -> Trainner.npz; returns the output path."""
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(model_path)
+    out_path = out_path or compact_path(model_path)
+    save(from_recognizer(recognizer), out_path)
+    return out_path
+
+
+def save_opencv(recognizer, model_path):
+    """Write an OpenCV LBPH model next to its final path and rename it into place.
+
+    Recognition processes reload the model when it changes, so they must
+    never see a half-written file. OpenCV picks the format from the
+    extension, hence the .tmp.yml suffix.
+    """
+    root, ext = os.path.splitext(model_path)
+    tmp = f"{root}.tmp{ext}"
+    recognizer.save(tmp)
+    os.replace(tmp, model_path)
+
+
+def load_recognizer(model_path):
+    """Compact model when it is at least as new as model_path, else OpenCV's."""
+    npz = compact_path(model_path)
+    if os.path.isfile(npz) and (
+        not os.path.isfile(model_path)
+        or os.stat(npz).st_mtime_ns >= os.stat(model_path).st_mtime_ns
+    ):
+        return load(npz)
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(model_path)
+    return recognizer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Trainner.yml to the compact model")
+    parser.add_argument("model", help="LBPH model saved by OpenCV (Trainner.yml)")
+    parser.add_argument("-o", "--output", help="output .npz (default: next to the model)")
+    args = parser.parse_args(argv)
+    out = convert(args.model, args.output)
+    print(f"Wrote {out} ({os.path.getsize(out) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Process-wide registry of the Haar cascade and the recognizer model.
+
+The cascade XML and the model files of the recognizer backend (see
+recognizer_backends) are loaded once per process and handed out from a
+small pool, one (cascade, recognizer) pair per concurrent user, because
+OpenCV detector objects are not re-entrant. Read-only recognizers (the
+backend's shared flag, e.g. the LBPH matcher) are loaded once per model
+generation and the same object goes into every pair. When the model
+changes on disk the new model is loaded in the background and swapped in
+atomically; callers keep using the old pair until the new one is ready.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+
+import face_detector
+import recognizer_backends
+from file_cache import file_stamp
+
+POOL_SIZE = 4
+CHECK_INTERVAL = 1.0  # seconds between model file stat checks
+
+
+class FaceModels:
+    def __init__(self, cascade, recognizer, generation, detector=None):
+        self.cascade = cascade
+        self.recognizer = recognizer  # None until a model has been trained
+        self.generation = generation
+        # configured detector (face_detector) wrapping cascade
+        self.detector = detector
+
+
+class ModelRegistry:
+    def __init__(self, cascade_path, model_path, pool_size=POOL_SIZE, backend=None):
+        self.cascade_path = cascade_path
+        self.model_path = model_path
+        self.backend = recognizer_backends.get_backend(backend)
+        self.pool_size = max(int(pool_size), 1)
+        self.cond = threading.Condition()
+        self.idle = []
+        self.created = 0
+        self.generation = 0
+        self.stamp = self._stamp()
+        self.checked = 0.0
+        self.reloading = False
+        self.shared = (None, None)  # (generation, recognizer) of shared backends
+        self.shared_lock = threading.Lock()
+
+    def _recognizer(self, generation):
+        if not getattr(self.backend, "shared", False) or generation is None:
+            return self.backend.load(self.model_path)
+        # one load per generation even when several slots fill at once
+        with self.shared_lock:
+            with self.cond:
+                if self.shared[0] == generation:
+                    return self.shared[1]
+            recognizer = self.backend.load(self.model_path)
+            with self.cond:
+                if generation == self.generation:
+                    self.shared = (generation, recognizer)
+            return recognizer
+
+    def _load(self, generation):
+        cascade = cv2.CascadeClassifier(self.cascade_path)
+        detector = face_detector.create_detector(cascade)
+        recognizer = None
+        if self.has_model():
+            recognizer = self._recognizer(generation)
+        return FaceModels(cascade, recognizer, generation, detector)
+
+    def _check_for_update(self):
+        now = time.time()
+        with self.cond:
+            if self.reloading or now - self.checked < CHECK_INTERVAL:
+                return
+            self.checked = now
+            stamp = self._stamp()
+            if stamp == self.stamp:
+                return
+            self.reloading = True
+        threading.Thread(target=self._reload, args=(stamp,), daemon=True).start()
+
+    def _reload(self, stamp):
+        try:
+            models = self._load(None)
+        except (cv2.error, OSError, ValueError):
+            # half-written file from a non-atomic writer; retry on next check
+            with self.cond:
+                self.reloading = False
+            return
+        with self.cond:
+            self.generation += 1
+            models.generation = self.generation
+            if getattr(self.backend, "shared", False):
+                self.shared = (self.generation, models.recognizer)
+            self.stamp = stamp
+            self.idle = [models]
+            self.created = 1
+            self.reloading = False
+            self.cond.notify_all()
+
+    @contextmanager
+    def acquire(self):
+        """Borrow a FaceModels pair for the current thread."""
+        self._check_for_update()
+        with self.cond:
+            while not self.idle and self.created >= self.pool_size:
+                self.cond.wait()
+            models = self.idle.pop() if self.idle else None
+            if models is None:
+                self.created += 1
+                generation = self.generation
+        if models is None:
+            try:
+                models = self._load(generation)
+            except Exception:
+                with self.cond:
+                    self.created -= 1
+                    self.cond.notify()
+                raise
+        try:
+            yield models
+        finally:
+            with self.cond:
+                # pairs of a swapped-out model are dropped; they are not
+                # counted against the new generation's pool
+                if models.generation == self.generation:
+                    self.idle.append(models)
+                self.cond.notify()
+
+    def _stamp(self):
+        if not self.model_path:
+            return None
+        stamps = tuple(
+            file_stamp(path) for path in self.backend.model_files(self.model_path)
+        )
+        return stamps if any(stamps) else None
+
+    def has_model(self):
+        return bool(self.model_path) and self.backend.has_model(self.model_path)
+
+    def reload(self):
+        """Drop every cached pair; the next acquire loads from disk."""
+        with self.cond:
+            self.generation += 1
+            self.stamp = self._stamp()
+            self.idle = []
+            self.created = 0
+            self.cond.notify_all()
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(cascade_path, model_path=None, pool_size=POOL_SIZE, backend=None):
+    """The shared registry for this cascade/model pair and backend.
+
+    Without a model_path the registry only hands out cascades.
+    """
+    backend = backend or recognizer_backends.RECOGNIZER_BACKEND
+    key = (cascade_path, model_path, backend)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = _registries[key] = ModelRegistry(
+                cascade_path, model_path, pool_size, backend
+            )
+        elif pool_size > registry.pool_size:
+            registry.pool_size = pool_size
+        return registry
@@ -0,0 +1,156 @@
+"""
+Capture / recognize / consume pipeline for live attendance.
+
+A capture thread keeps reading the camera and feeds a bounded queue, a pool
+of worker threads runs detection + recognition (OpenCV releases the GIL, so
+workers use separate cores), and the caller consumes results on its own
+thread, which is where cv2.imshow/waitKey must run.
+"""
+
+import queue
+import threading
+import time
+
+DROP_OLDEST = "oldest"  # replace the oldest queued frame with the new one
+DROP_NEWEST = "newest"  # discard the new frame when the queue is full
+BLOCK = "block"  # stall the capture thread until a worker is free
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class PipelineStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.captured = 0
+        self.dropped = 0
+        self.processed = 0
+        self.started = time.time()
+
+    def add(self, name, n=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def fps(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        return self.processed / elapsed
+
+    def __repr__(self):
+        return (
+            f"captured={self.captured} processed={self.processed} "
+            f"dropped={self.dropped} fps={self.fps():.1f}"
+        )
+
+
+class RecognitionPipeline:
+    """Run process(frame) on a worker pool over frames read from cam.
+
+    processors is a list of callables, one per worker thread, because
+    OpenCV cascade and recognizer objects must not be shared between threads.
+    Each returns the detections for one BGR frame.
+    """
+
+    def __init__(self, cam, processors, queue_size=4, drop_policy=DROP_OLDEST):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+        self.cam = cam
+        self.processors = processors
+        self.drop_policy = drop_policy
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.results = queue.Queue(maxsize=queue_size * max(len(processors), 1))
+        self.stop_event = threading.Event()
+        self.stats = PipelineStats()
+        self.threads = []
+        self.errors = []
+
+    def start(self):
+        self.threads.append(threading.Thread(target=self._capture, daemon=True))
+        for process in self.processors:
+            self.threads.append(
+                threading.Thread(target=self._work, args=(process,), daemon=True)
+            )
+        for t in self.threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        for t in self.threads:
+            t.join(timeout=2)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _put_frame(self, item):
+        if self.drop_policy == BLOCK:
+            while not self.stop_event.is_set():
+                try:
+                    self.frames.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+            return
+        if self.drop_policy == DROP_NEWEST:
+            try:
+                self.frames.put_nowait(item)
+            except queue.Full:
+                self.stats.add("dropped")
+            return
+        # only the capture thread puts, so this settles after one eviction
+        while True:
+            try:
+                self.frames.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.stats.add("dropped")
+                except queue.Empty:
+                    pass
+
+    def _capture(self):
+        seq = 0
+        while not self.stop_event.is_set():
+            ret, frame = self.cam.read()
+            if not ret:
+                time.sleep(0.005)
+                continue
+            seq += 1
+            self.stats.add("captured")
+            self._put_frame((seq, frame))
+
+    def _work(self, process):
+        while not self.stop_event.is_set():
+            try:
+                seq, frame = self.frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                detections = process(frame)
+            except Exception as err:
+                self.errors.append(err)
+                continue
+            self.stats.add("processed")
+            while not self.stop_event.is_set():
+                try:
+                    self.results.put((seq, frame, detections), timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def iter_results(self, deadline=None, timeout=0.05):
+        """Yield (seq, frame, detections) until deadline (a time.time()).
+
+        Workers finish out of order; results are yielded as they arrive and
+        callers that display frames should skip stale sequence numbers.
+        Yields None when nothing arrived within timeout so the caller can
+        keep its UI responsive.
+        """
+        while deadline is None or time.time() < deadline:
+            if self.errors:
+                raise self.errors[0]
+            try:
+                yield self.results.get(timeout=timeout)
+            except queue.Empty:
+                yield None
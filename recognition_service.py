@@ -0,0 +1,307 @@
+"""
+Local face recognition service for the Streamlit front end.
+
+    python recognition_service.py                   # http://127.0.0.1:8765
+    python recognition_service.py --socket /tmp/face.sock
+
+POST /recognize with an encoded image (JPEG/PNG, e.g. the bytes of a
+st.camera_input snapshot) as the body returns
+
+    {"faces": [{"box": [x, y, w, h], "enrollment": 42, "confidence": 31.5}]}
+
+enrollment is null when no student is below the backend's threshold.
+GET /health is a cheap liveness/queue check, GET /metrics returns the
+frame_ingest counters and latency percentiles.
+
+Frames go through frame_ingest: requests that arrive together are
+micro-batched (BATCH_MAX frames or BATCH_WAIT_MS, whichever comes first)
+and all faces of a batch go through one predict_batch call with a single
+(detector, recognizer) pair from the model registry; SERVICE_WORKERS
+batches run at once. When the queue is full or a frame waited too long the
+answer is 429 with a Retry-After header. The HTTP layer is plain asyncio
+streams, so the service needs nothing beyond the standard library and
+OpenCV.
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import socket
+import threading
+
+import cv2
+import numpy as np
+
+import face_preprocess
+import frame_ingest
+import model_registry
+from recognizer_backends import predict_many
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+haarcasecade_path = os.path.join(BASE_DIR, "haarcascade_frontalface_alt.xml")
+trainimagelabel_path = os.path.join(BASE_DIR, "TrainingImageLabel", "Trainner.yml")
+
+SERVICE_HOST = os.environ.get("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("SERVICE_PORT", 8765))
+SERVICE_SOCKET = os.environ.get("SERVICE_SOCKET", "")
+SERVICE_WORKERS = int(os.environ.get("SERVICE_WORKERS", 2))
+MAX_BODY = 10 * 1024 * 1024
+CLIENT_TIMEOUT = 10.0
+
+
+def recognize_frames(frames, detector, recognizer, threshold):
+    """Per frame, a list of {box, enrollment, confidence} dicts.
+
+    Frames are BGR or grayscale images; None (undecodable) gives no faces.
+    The faces of every frame are predicted in one batched call.
+    """
+    crops, owners, results = [], [], []
+    for i, frame in enumerate(frames):
+        results.append([])
+        if frame is None:
+            continue
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        for x, y, w, h in detector.detect(gray, scale_factor=1.2, min_neighbors=5):
+            crops.append(face_preprocess.face_crop(gray, (x, y, w, h)))
+            owners.append((i, [int(x), int(y), int(w), int(h)]))
+    if recognizer is None:
+        preds = [(-1, float("inf"))] * len(crops)
+    else:
+        preds = predict_many(recognizer, crops)
+    for (i, box), (Id, conf) in zip(owners, preds):
+        results[i].append(
+            {
+                "box": box,
+                "enrollment": int(Id) if conf < threshold else None,
+                "confidence": round(float(conf), 2),
+            }
+        )
+    return results
+
+
+class BatchRecognizer:
+    """frame_ingest process_batch: encoded images -> one result dict each."""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.threshold = registry.backend.threshold
+
+    def __call__(self, blobs):
+        frames = [
+            cv2.imdecode(np.frombuffer(blob, np.uint8), cv2.IMREAD_GRAYSCALE)
+            for blob in blobs
+        ]
+        with self.registry.acquire() as models:
+            results = recognize_frames(
+                frames, models.detector, models.recognizer, self.threshold
+            )
+        return [
+            {"faces": faces} if frame is not None else {"error": "cannot decode image"}
+            for frame, faces in zip(frames, results)
+        ]
+
+
+def create_ingest(registry, workers=SERVICE_WORKERS):
+    return frame_ingest.FrameIngest(BatchRecognizer(registry), workers)
+
+
+_local_ingest = {}
+_local_lock = threading.Lock()
+
+
+def local_ingest(registry):
+    """Process-wide ingest for recognizing without the service (one per registry).
+
+    Streamlit serves every browser session from threads of one process, so
+    snapshots submitted at the same time are still batched together.
+    """
+    with _local_lock:
+        ingest = _local_ingest.get(id(registry))
+        if ingest is None:
+            ingest = create_ingest(registry, registry.pool_size)
+            _local_ingest[id(registry)] = ingest
+        return ingest
+
+
+async def read_request(reader):
+    """(method, path, headers, body) or None at end of connection."""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, path, _ = line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise ValueError("request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+
+def write_response(writer, status, payload, keep_alive=True, headers=None):
+    body = json.dumps(payload).encode()
+    reason = http.client.responses.get(status, "")
+    extra = "".join(f"{k}: {v}\r\n" for k, v in (headers or {}).items())
+    writer.write(
+        (
+            f"HTTP/1.1 {status} {reason}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"{extra}"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode()
+        + body
+    )
+
+
+def overloaded(err):
+    return (
+        429,
+        {"error": str(err), "retry_after": err.retry_after},
+        {"Retry-After": str(err.retry_after)},
+    )
+
+
+class RecognitionService:
+    def __init__(self, ingest):
+        self.ingest = ingest
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except (ValueError, asyncio.IncompleteReadError) as err:
+                    write_response(writer, 400, {"error": str(err)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload, extra = await self.route(
+                    method, path.split("?")[0], body
+                )
+                write_response(writer, status, payload, keep_alive, extra)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        """(status, payload, extra headers) for one request."""
+        if path == "/health" and method == "GET":
+            depth = self.ingest.depth()
+            status = "overloaded" if depth >= self.ingest.queue_max else "ok"
+            return 200, {"status": status, "queue_depth": depth}, None
+        if path == "/metrics" and method == "GET":
+            return 200, self.ingest.metrics(), None
+        if path == "/recognize" and method == "POST":
+            if not body:
+                return 400, {"error": "empty body; POST an encoded image"}, None
+            try:
+                result = await asyncio.wrap_future(self.ingest.submit(body))
+            except frame_ingest.Overloaded as err:
+                return overloaded(err)
+            return (400 if "error" in result else 200), result, None
+        return 404, {"error": f"no route {method} {path}"}, None
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT, unix_socket=None):
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            server = await asyncio.start_unix_server(self.handle, unix_socket)
+            where = unix_socket
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            where = f"http://{host}:{port}"
+        print(f"Recognition service on {where} ({self.ingest.workers} workers)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.ingest.close()
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connection(timeout):
+    if SERVICE_SOCKET:
+        return _UnixConnection(SERVICE_SOCKET, timeout)
+    return http.client.HTTPConnection(SERVICE_HOST, SERVICE_PORT, timeout=timeout)
+
+
+def recognize(image_bytes, timeout=CLIENT_TIMEOUT):
+    """Client: POST an encoded image to the service, return its face list.
+
+    Raises ConnectionError when the service is not running (connection
+    refused, no socket file) and frame_ingest.Overloaded when it sheds the
+    frame (HTTP 429) or is running but does not answer in time, so a busy
+    service means "retry later", not recognizing the frame in-process too.
+    """
+    conn = _connection(timeout)
+    try:
+        conn.request(
+            "POST", "/recognize", body=image_bytes,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        response = conn.getresponse()
+        payload = json.loads(response.read())
+    except (ConnectionRefusedError, FileNotFoundError) as err:
+        raise ConnectionError(f"recognition service unavailable: {err}") from err
+    except (OSError, http.client.HTTPException) as err:
+        # timed out or dropped the connection: running, but too busy
+        raise frame_ingest.Overloaded(
+            f"recognition service did not answer: {err}"
+        ) from err
+    finally:
+        conn.close()
+    if response.status == 429:
+        raise frame_ingest.Overloaded(
+            payload.get("error", "overloaded"), payload.get("retry_after", 1)
+        )
+    if response.status != 200:
+        raise ValueError(payload.get("error", f"HTTP {response.status}"))
+    return payload["faces"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local face recognition service")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--socket", default=SERVICE_SOCKET, help="Unix socket path")
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    parser.add_argument("--backend", help="recognizer backend (RECOGNIZER_BACKEND)")
+    args = parser.parse_args(argv)
+
+    registry = model_registry.get_registry(
+        haarcasecade_path, trainimagelabel_path, args.workers, backend=args.backend
+    )
+    service = RecognitionService(create_ingest(registry, args.workers))
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
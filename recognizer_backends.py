@@ -0,0 +1,259 @@
+"""
+Face recognizer backends.
+
+A backend turns the packed training faces (training_cache) into a model
+file next to Trainner.yml and loads that file back as a recognizer with
+predict(face) / predict_batch(faces) -> (enrollment, confidence). The
+confidence is a distance: lower is better and a prediction is accepted
+below the backend's threshold, like the LBPH confidence the rest of the
+code already uses.
+
+    lbph   local binary pattern histograms (lbph_model / lbph_matcher)
+    sface  128-d SFace embeddings computed with cv2.dnn from an ONNX file,
+           matched by cosine similarity against one unit-length centroid
+           per student
+
+Pick one with RECOGNIZER_BACKEND (default lbph).
+"""
+
+import json
+import os
+import zipfile
+
+import cv2
+import numpy as np
+
+import lbph_matcher
+import lbph_model
+import training_cache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+RECOGNIZER_BACKEND = os.environ.get("RECOGNIZER_BACKEND", "lbph")
+# also write the (large, slow to parse) OpenCV Trainner.yml
+SAVE_OPENCV_MODEL = os.environ.get("SAVE_OPENCV_MODEL", "0") == "1"
+SFACE_MODEL_PATH = os.environ.get(
+    "SFACE_MODEL_PATH",
+    os.path.join(BASE_DIR, "models", "face_recognition_sface_2021dec.onnx"),
+)
+SFACE_BATCH_SIZE = 32
+
+
+def _save_npz(path, **arrays):
+    tmp = os.path.splitext(path)[0] + ".tmp.npz"
+    with open(tmp, "wb") as fh:
+        np.savez(fh, **arrays)
+    os.replace(tmp, path)
+
+
+class LBPHBackend:
+    name = "lbph"
+    threshold = 70
+    shared = True  # matchers are read-only: one serves every registry slot
+
+    def model_files(self, model_path):
+        files = [model_path, lbph_model.compact_path(model_path)]
+        if lbph_matcher.MATCH_PROTOTYPES:
+            files.append(
+                lbph_matcher.prototype_path(model_path, lbph_matcher.MATCH_PROTOTYPES)
+            )
+        return files
+
+    def has_model(self, model_path):
+        return any(os.path.isfile(p) for p in self.model_files(model_path)[:2])
+
+    def train(self, faces, labels):
+        return lbph_model.train(faces, labels)
+
+    def extend(self, model_path, faces, labels):
+        # a Trainner.yml-only install is converted on the way
+        model = lbph_model.load_recognizer(model_path)
+        if not isinstance(model, lbph_model.LBPHModel):
+            model = lbph_model.from_recognizer(model)
+        return model.extend(faces, labels)
+
+    def save(self, model, model_path, changed=None):
+        lbph_model.save(model, lbph_model.compact_path(model_path))
+        if lbph_matcher.MATCH_PROTOTYPES:
+            # only students with new images need their prototypes recomputed
+            lbph_matcher.save_prototypes(
+                model, model_path, lbph_matcher.MATCH_PROTOTYPES, changed
+            )
+        if SAVE_OPENCV_MODEL:
+            # the OpenCV object cannot take our histograms; retrain it
+            faces, labels, _ = training_cache.load_cache(
+                training_cache.cache_dir_for(model_path)
+            )
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.train(list(faces), np.asarray(labels))
+            lbph_model.save_opencv(recognizer, model_path)
+
+    def load(self, model_path):
+        return lbph_matcher.load_recognizer(model_path)
+
+
+class EmbeddingModel:
+    """Unit-length embeddings (one row per training face) plus labels."""
+
+    def __init__(self, embeddings, labels):
+        self.embeddings = embeddings
+        self.labels = np.asarray(labels, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def extend(self, embeddings, labels):
+        return EmbeddingModel(
+            np.concatenate([np.asarray(self.embeddings), embeddings]),
+            np.concatenate([self.labels, np.asarray(labels, dtype=np.int32)]),
+        )
+
+
+class EmbeddingIndex:
+    """Cosine matcher over one centroid per student.
+
+    Centroids are built once at load, so a batch of faces costs one
+    (faces x 128) @ (128 x students) product regardless of how many images
+    each student enrolled.
+    """
+
+    def __init__(self, model, embed):
+        self.embed = embed
+        self.classes, inverse = np.unique(model.labels, return_inverse=True)
+        centroids = np.zeros(
+            (len(self.classes), np.asarray(model.embeddings).shape[1]), np.float32
+        )
+        np.add.at(centroids, inverse, np.asarray(model.embeddings, np.float32))
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.maximum(norms, 1e-12)
+
+    def __len__(self):
+        return len(self.classes)
+
+    def match(self, embeddings):
+        """[(label, confidence)] for unit-length query embeddings."""
+        if not len(self.classes):
+            return [(-1, float("inf"))] * len(embeddings)
+        scores = embeddings @ self.centroids.T
+        best = np.argmax(scores, axis=1)
+        sims = scores[np.arange(len(best)), best]
+        # cosine similarity as a 0..200 distance: 100 * (1 - cos)
+        return [
+            (int(self.classes[b]), float(100 * (1 - s))) for b, s in zip(best, sims)
+        ]
+
+    def predict_batch(self, faces):
+        if not len(faces):
+            return []
+        return self.match(self.embed(faces))
+
+    def predict(self, face):
+        return self.predict_batch([face])[0]
+
+
+class SFaceBackend:
+    name = "sface"
+    # SFace's recommended cosine threshold 0.363, on the 100 * (1 - cos) scale
+    threshold = 100 * (1 - 0.363)
+    input_size = (112, 112)
+    shared = False  # each recognizer owns a cv2.dnn net
+
+    def __init__(self, onnx_path=SFACE_MODEL_PATH):
+        self.onnx_path = onnx_path
+
+    def embeddings_path(self, model_path):
+        return os.path.splitext(model_path)[0] + ".sface.npz"
+
+    def model_files(self, model_path):
+        return [self.embeddings_path(model_path)]
+
+    def has_model(self, model_path):
+        return os.path.isfile(self.embeddings_path(model_path))
+
+    def _net(self):
+        if not os.path.isfile(self.onnx_path):
+            raise FileNotFoundError(
+                f"SFace model not found at {self.onnx_path}; set SFACE_MODEL_PATH"
+            )
+        return cv2.dnn.readNetFromONNX(self.onnx_path)
+
+    def embedder(self):
+        """embed(faces) -> (N, 128) unit-length float32, with its own net.
+
+        cv2.dnn nets are not re-entrant, so every recognizer (and so every
+        model registry slot) owns one.
+        """
+        net = self._net()
+        size = self.input_size
+
+        def forward(images):
+            # same preprocessing as cv2.FaceRecognizerSF: BGR -> RGB, no scaling
+            blob = cv2.dnn.blobFromImages(images, 1.0, size, (0, 0, 0), True, False)
+            net.setInput(blob)
+            return net.forward().reshape(len(images), -1)
+
+        def embed(faces):
+            images = [
+                cv2.cvtColor(f, cv2.COLOR_GRAY2BGR) if f.ndim == 2 else f
+                for f in faces
+            ]
+            out = []
+            for i in range(0, len(images), SFACE_BATCH_SIZE):
+                batch = images[i : i + SFACE_BATCH_SIZE]
+                try:
+                    out.append(forward(batch))
+                except cv2.error:
+                    # exported with a fixed batch of 1
+                    out.extend(forward([image]) for image in batch)
+            vectors = np.concatenate(out).astype(np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            return vectors / np.maximum(norms, 1e-12)
+
+        return embed
+
+    def train(self, faces, labels):
+        embed = self.embedder()
+        return EmbeddingModel(embed(list(faces)), labels)
+
+    def extend(self, model_path, faces, labels):
+        # new faces are embedded and appended; nothing is retrained
+        embed = self.embedder()
+        return self._load_model(model_path).extend(embed(list(faces)), labels)
+
+    def save(self, model, model_path, changed=None):
+        meta = {"onnx": os.path.basename(self.onnx_path)}
+        _save_npz(
+            self.embeddings_path(model_path),
+            embeddings=np.asarray(model.embeddings, np.float32),
+            labels=model.labels,
+            meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8),
+        )
+
+    def _load_model(self, model_path):
+        path = self.embeddings_path(model_path)
+        with zipfile.ZipFile(path) as zf:
+            embeddings = lbph_model.mmap_member(path, zf, "embeddings")
+            labels = np.load(zf.open("labels.npy"))
+        return EmbeddingModel(embeddings, labels)
+
+    def load(self, model_path):
+        return EmbeddingIndex(self._load_model(model_path), self.embedder())
+
+
+def predict_many(recognizer, faces):
+    """predict_batch when the recognizer has it, else one predict per face."""
+    if hasattr(recognizer, "predict_batch"):
+        return recognizer.predict_batch(faces)
+    return [recognizer.predict(face) for face in faces]
+
+
+BACKENDS = {"lbph": LBPHBackend, "sface": SFaceBackend}
+
+
+def get_backend(name=None):
+    name = (name or RECOGNIZER_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown recognizer backend {name!r}; choose from {', '.join(BACKENDS)}"
+        )
+    return BACKENDS[name]()
@@ -0,0 +1,292 @@
+"""
+Cached access to StudentDetails/studentdetails.csv.
+
+The roster is parsed once and kept as a cleaned DataFrame plus an
+enrollment -> name dict. Entries are invalidated when the file's mtime or
+size changes, so every caller shares one parse per edit of the file.
+
+Registrations go through add_students(), which is safe across threads,
+processes and kiosks sharing the folder:
+
+* writers hold an exclusive lock on studentdetails.csv.lock while they
+  append, so rows never interleave;
+* the enrollment -> name index rejects enrollments that are already on
+  the roster (the first registration wins), also within a batch;
+* concurrent callers in one process are group-committed: whoever finds
+  no write in progress appends everybody's pending rows with one write
+  and one fsync;
+* a torn last line (crash mid-append) is cut off before appending, and a
+  file holding duplicate enrollments (written before this module did the
+  writes) is compacted to a temp file and renamed over the original.
+"""
+
+import csv
+import io
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+COLUMNS = ["Enrollment", "Name"]
+
+_lock = threading.Lock()
+_cache = {}  # path -> (stamp, DataFrame, {enrollment: name})
+_writers = {}  # path -> _GroupWriter
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _parse(path):
+    df = pd.read_csv(path)
+    if "Enrollment" not in df.columns or "Name" not in df.columns:
+        if df.shape[1] >= 2:
+            df = df.iloc[:, :2]
+            df.columns = COLUMNS
+        else:
+            raise ValueError(
+                "Student details file is corrupted. Please register again."
+            )
+    df = df.dropna(subset=COLUMNS)
+    try:
+        df["Enrollment"] = df["Enrollment"].astype(int)
+    except ValueError:
+        raise ValueError("Enrollment IDs must be numeric. Please re-register students.")
+    df["Name"] = df["Name"].astype(str)
+    # rows appended before writes were deduplicated: the first one wins
+    df = df[COLUMNS].drop_duplicates("Enrollment").reset_index(drop=True)
+    names = dict(zip(df["Enrollment"].tolist(), df["Name"].tolist()))
+    return df, names
+
+
+def _load(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            "Student details not found. Please register a student first."
+        )
+    stamp = _stamp(path)
+    with _lock:
+        entry = _cache.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1], entry[2]
+    df, names = _parse(path)
+    with _lock:
+        _cache[path] = (stamp, df, names)
+    return df, names
+
+
+def load_roster(path):
+    """Cleaned roster DataFrame (int Enrollment, str Name); do not mutate it.
+
+    Raises FileNotFoundError or ValueError with a user-facing message.
+    """
+    return _load(path)[0]
+
+
+def name_index(path):
+    """{enrollment: name} for the current roster; do not mutate it."""
+    return _load(path)[1]
+
+
+def lookup_name(path, enrollment, default="Unknown"):
+    return name_index(path).get(int(enrollment), default)
+
+
+def invalidate(path=None):
+    with _lock:
+        if path is None:
+            _cache.clear()
+        else:
+            _cache.pop(path, None)
+
+
+def _lock_file(fh):
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        return
+    fh.seek(0)
+    while True:
+        try:
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:  # LK_LOCK gives up after 10 s; keep waiting
+            pass
+
+
+def _unlock_file(fh):
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+    else:
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _cut_torn_line(path):
+    """Drop a partial last row left by an interrupted append."""
+    with open(path, "rb+") as fh:
+        size = fh.seek(0, os.SEEK_END)
+        if not size:
+            return
+        fh.seek(size - 1)
+        if fh.read(1) == b"\n":
+            return
+        fh.seek(0)
+        data = fh.read()
+        fh.truncate(data.rfind(b"\n") + 1)
+
+
+def _csv_rows(rows):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue()
+
+
+def _write_durable(fh, text):
+    fh.write(text)
+    fh.flush()
+    os.fsync(fh.fileno())
+
+
+def compact(path):
+    """Rewrite the roster without duplicates via temp file + atomic rename.
+
+    Call with the roster lock held (add_students does).
+    """
+    df, names = _parse(path)
+    tmp = path + ".tmp"
+    with open(tmp, "w", newline="") as fh:
+        _write_durable(fh, _csv_rows([COLUMNS] + df.values.tolist()))
+    os.replace(tmp, path)
+    return df, names
+
+
+def _append(path, batch):
+    """Append the new rows of every request in batch with one fsync.
+
+    Runs with the roster lock held; each request's "added" list gets the
+    rows that were written for it.
+    """
+    if os.path.isfile(path) and os.path.getsize(path):
+        with _lock:
+            entry = _cache.get(path)
+        if entry is not None and entry[0] == _stamp(path):
+            # unchanged since it was last read or written here
+            df, names = entry[1], entry[2]
+        else:
+            _cut_torn_line(path)
+            df, names = _parse(path)
+            with open(path, newline="") as fh:
+                raw_rows = sum(1 for _ in fh) - 1
+            if raw_rows != len(df):
+                df, names = compact(path)
+        header = False
+    else:
+        df, names = pd.DataFrame(columns=COLUMNS), {}
+        header = True
+    names = dict(names)
+    new_rows = []
+    for request in batch:
+        for enrollment, name in request["rows"]:
+            if enrollment in names:
+                continue
+            names[enrollment] = name
+            new_rows.append([enrollment, name])
+            request["added"].append((enrollment, name))
+    if not new_rows:
+        return
+    text = _csv_rows(([COLUMNS] if header else []) + new_rows)
+    with open(path, "a", newline="") as fh:
+        _write_durable(fh, text)
+    df = pd.concat([df, pd.DataFrame(new_rows, columns=COLUMNS)], ignore_index=True)
+    df = df.astype({"Enrollment": "int64", "Name": str})
+    # the writer already knows the new roster; save readers a re-parse
+    with _lock:
+        _cache[path] = (_stamp(path), df, names)
+
+
+class _GroupWriter:
+    """Batches concurrent add_students() calls of one process per file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.cond = threading.Condition()
+        self.pending = []  # requests not written yet
+        self.writing = False
+
+    def _write(self, batch):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + ".lock", "a+") as lock:
+            _lock_file(lock)
+            try:
+                _append(self.path, batch)
+            finally:
+                _unlock_file(lock)
+
+    def add(self, rows):
+        request = {"rows": rows, "added": [], "error": None, "done": False}
+        with self.cond:
+            self.pending.append(request)
+            while self.writing and not request["done"]:
+                self.cond.wait()
+            if not request["done"]:
+                # nobody is writing: write every pending request at once
+                batch, self.pending = self.pending, []
+                self.writing = True
+        if not request["done"]:
+            error = None
+            try:
+                self._write(batch)
+            except Exception as err:
+                error = err
+            with self.cond:
+                for done in batch:
+                    done["error"] = error
+                    done["done"] = True
+                self.writing = False
+                self.cond.notify_all()
+        if request["error"] is not None:
+            raise request["error"]
+        return request["added"]
+
+
+def validate_student(enrollment, name):
+    """(int enrollment, stripped name) as stored on the roster.
+
+    Raises ValueError for a non-numeric enrollment or an empty name, so
+    callers can check a student before capturing any images.
+    """
+    try:
+        enrollment = int(enrollment)
+    except (TypeError, ValueError):
+        raise ValueError(f"Enrollment must be numeric, got {enrollment!r}")
+    name = str(name).strip()
+    if not name:
+        raise ValueError(f"Name is empty for enrollment {enrollment}")
+    return enrollment, name
+
+
+def add_students(path, rows):
+    """Register (enrollment, name) rows; returns the rows actually added.
+
+    Enrollments already on the roster, or repeated in rows, are skipped.
+    Raises ValueError for a non-numeric enrollment or an empty name.
+    """
+    clean = [validate_student(enrollment, name) for enrollment, name in rows]
+    with _lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = _GroupWriter(path)
+    return writer.add(clean)
+
+
+def add_student(path, enrollment, name):
+    """True if the student was added, False if the enrollment exists."""
+    return bool(add_students(path, [(enrollment, name)]))
@@ -0,0 +1,51 @@
+"""
+Writing attendance sessions to Attendance/<Subject>/<Subject>_<date>_<time>.csv.
+"""
+
+import datetime
+import os
+
+import attendance_db
+import attendance_store
+
+
+def session_filename(attendance_path, subject, when=None):
+    when = when or datetime.datetime.now()
+    date = when.strftime("%Y-%m-%d")
+    return os.path.join(
+        attendance_path,
+        subject,
+        f"{subject}_{date}_{when.strftime('%H-%M-%S')}.csv",
+    )
+
+
+def write_session(attendance_path, subject, attendance, when=None):
+    """Save an Enrollment/Name frame as one session; returns the file name.
+
+    The session column is named after the date and holds 1 for every row,
+    which is the format show_attendance and app.py read back. The session is
+    also stored in the attendance database when ATTENDANCE_DB is set, and in
+    the subject's columnar store otherwise.
+    """
+    when = when or datetime.datetime.now()
+    fileName = session_filename(attendance_path, subject, when)
+    # two sessions in the same second (batch runs) must not overwrite each other
+    while os.path.exists(fileName):
+        when += datetime.timedelta(seconds=1)
+        fileName = session_filename(attendance_path, subject, when)
+    attendance = attendance.copy()
+    attendance[when.strftime("%Y-%m-%d")] = 1
+    os.makedirs(os.path.dirname(fileName), exist_ok=True)
+    attendance.to_csv(fileName, index=False)
+    session = os.path.splitext(os.path.basename(fileName))[0]
+    db = attendance_db.get_db()
+    if db is not None:
+        db.write_session(subject, session, when.strftime("%Y-%m-%d"), attendance, when)
+        return fileName
+    attendance_store.append_session(
+        os.path.dirname(fileName),
+        session,
+        when.strftime("%Y-%m-%d"),
+        attendance,
+    )
+    return fileName
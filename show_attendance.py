@@ -1,39 +1,37 @@
-import pandas as pd
-from glob import glob
 import os
 import tkinter
-import csv
 import tkinter as tk
 from tkinter import *
 
+import attendance_db
+import attendance_report
+import attendance_store
+import roster
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ATTENDANCE_ROOT = os.path.join(BASE_DIR, "Attendance")
+STUDENTDETAIL_PATH = os.path.join(BASE_DIR, "StudentDetails", "studentdetails.csv")
 
 
 def subjectchoose(text_to_speech):
-    def show_table(csv_path, subject_name):
+    def show_table(report, subject_name):
         root = tkinter.Tk()
         root.title("Attendance of " + subject_name)
         root.configure(background="black")
-        with open(csv_path, newline="") as file:
-            reader = csv.reader(file)
-            r = 0
-            for col in reader:
-                c = 0
-                for row in col:
-                    label = tkinter.Label(
-                        root,
-                        width=15,
-                        height=1,
-                        fg="yellow",
-                        font=("times", 15, " bold "),
-                        bg="black",
-                        text=row,
-                        relief=tkinter.RIDGE,
-                    )
-                    label.grid(row=r, column=c)
-                    c += 1
-                r += 1
+        rows = [list(report.columns)] + report.astype(str).values.tolist()
+        for r, col in enumerate(rows):
+            for c, row in enumerate(col):
+                label = tkinter.Label(
+                    root,
+                    width=15,
+                    height=1,
+                    fg="yellow",
+                    font=("times", 15, " bold "),
+                    bg="black",
+                    text=row,
+                    relief=tkinter.RIDGE,
+                )
+                label.grid(row=r, column=c)
         root.mainloop()
 
     def calculate_attendance():
@@ -43,69 +41,41 @@ def subjectchoose(text_to_speech):
             text_to_speech(t)
             return
 
+        db = attendance_db.get_db()
+        if db is not None:
+            # percentages are aggregated by the database
+            report = db.summary(subject_name)
+            if report.empty:
+                text_to_speech(f"No attendance records found for {subject_name}.")
+                return
+            text_to_speech("Attendance generated successfully.")
+            show_table(report, subject_name)
+            return
+
         subject_dir = os.path.join(ATTENDANCE_ROOT, subject_name)
         if not os.path.isdir(subject_dir):
             t = f"No attendance folder found for {subject_name}."
             text_to_speech(t)
             return
 
-        pattern = os.path.join(subject_dir, f"{subject_name}_*.csv")
-        filenames = glob(pattern)
-        if not filenames:
+        if not attendance_store.session_csvs(subject_dir, subject_name):
             t = f"No attendance files found for {subject_name}."
             text_to_speech(t)
             return
 
-        session_frames = []
-        base_cols = ["Enrollment", "Name"]
-
-        for file in filenames:
-            try:
-                df = pd.read_csv(file)
-            except Exception:
-                continue
-            date_cols = [col for col in df.columns if col not in base_cols]
-            if not date_cols:
-                continue
-            session_col = date_cols[0]
-            session_name = os.path.splitext(os.path.basename(file))[0]
-            frame = df[base_cols + [session_col]].rename(
-                columns={session_col: session_name}
-            )
-            session_frames.append(frame)
-
-        if not session_frames:
+        try:
+            names = roster.name_index(STUDENTDETAIL_PATH)
+        except (FileNotFoundError, ValueError):
+            names = {}
+        # only sessions added since the last refresh are read
+        merged = attendance_report.refresh_summary(subject_dir, subject_name, names)
+        if merged.empty:
             t = f"Attendance data is corrupted for {subject_name}."
             text_to_speech(t)
             return
 
-        merged = session_frames[0]
-        for frame in session_frames[1:]:
-            merged = merged.merge(frame, on=base_cols, how="outer")
-        merged.fillna(0, inplace=True)
-
-        session_cols = [col for col in merged.columns if col not in base_cols]
-        if not session_cols:
-            t = f"No attendance values stored for {subject_name}."
-            text_to_speech(t)
-            return
-
-        merged[session_cols] = merged[session_cols].apply(
-            pd.to_numeric, errors="coerce"
-        ).fillna(0)
-
-        merged["Attendance"] = (
-            (merged[session_cols].mean(axis=1, numeric_only=True) * 100)
-            .round()
-            .astype(int)
-            .astype(str)
-            + "%"
-        )
-
-        summary_path = os.path.join(subject_dir, "attendance.csv")
-        merged.to_csv(summary_path, index=False)
         text_to_speech("Attendance generated successfully.")
-        show_table(summary_path, subject_name)
+        show_table(merged, subject_name)
 
     subject = Tk()
     subject.title("Subject...")
@@ -1,10 +1,57 @@
-import csv
 import os, cv2
 import numpy as np
 import pandas as pd
 import datetime
 import time
 
+import attendance_db
+import face_augment
+import face_preprocess
+import model_registry
+import roster
+import training_cache
+
+# capture: save every detected face (about 50 per student)
+# augment: capture a few frames, keep the diverse ones and add synthetic
+#          variants (face_augment); fewer samples, smaller model
+ENROLL_MODE = os.environ.get("ENROLL_MODE", "capture")
+
+
+def captureAugmented(cam, detector, path, Enrollment, Name):
+    """Capture face_augment.CAPTURE_FRAMES faces, save the compact sample set.
+
+    Returns the number of images written. Existing images of the student
+    are kept; new ones are numbered after them.
+    """
+    crops = []
+    while len(crops) < face_augment.CAPTURE_FRAMES:
+        ret, img = cam.read()
+        if not ret:
+            break
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        faces = detector.detect(gray, scale_factor=1.3, min_neighbors=5)
+        if len(faces):
+            # the enrolling student is the largest face in view
+            x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+            cv2.rectangle(img, (x, y), (x + w, y + h), (255, 0, 0), 2)
+            crops.append(face_preprocess.face_crop(gray, (x, y, w, h)))
+        cv2.putText(
+            img, "Turn your head slowly", (10, 30),
+            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2,
+        )
+        cv2.imshow("Frame", img)
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            break
+    samples = face_augment.enrollment_samples(crops)
+    first = training_cache.next_sample_number(path)
+    for n, sample in enumerate(samples, start=first):
+        # equalized like every other face; the light gradients survive it
+        face_preprocess.save_face(
+            os.path.join(path, f"{Name}_{Enrollment}_{n}{face_preprocess.FACE_EXT}"),
+            face_preprocess.normalize(sample),
+        )
+    return len(samples)
+
 # take Image of user
 def TakeImage(l1, l2, haarcasecade_path, trainimage_path, message, err_screen,text_to_speech):
     if (l1 == "") and (l2==""):
@@ -18,49 +65,58 @@ def TakeImage(l1, l2, haarcasecade_path, trainimage_path, message, err_screen,te
         text_to_speech(t)
     else:
         try:
+            # reject a bad enrollment or name before any image is written
+            roster.validate_student(l1, l2)
+            registry = model_registry.get_registry(haarcasecade_path)
             cam = cv2.VideoCapture(0)
-            detector = cv2.CascadeClassifier(haarcasecade_path)
             Enrollment = l1
             Name = l2
             sampleNum = 0
             directory = Enrollment + "_" + Name
             path = os.path.join(trainimage_path, directory)
             os.makedirs(path, exist_ok=True)
-            while True:
-                ret, img = cam.read()
-                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                faces = detector.detectMultiScale(gray, 1.3, 5)
-                for (x, y, w, h) in faces:
-                    cv2.rectangle(img, (x, y), (x + w, y + h), (255, 0, 0), 2)
-                    sampleNum = sampleNum + 1
-                    file_name = f"{Name}_{Enrollment}_{sampleNum}.jpg"
-                    cv2.imwrite(
-                        os.path.join(path, file_name),
-                        gray[y : y + h, x : x + w],
-                    )
-                    cv2.imshow("Frame", img)
-                if cv2.waitKey(1) & 0xFF == ord("q"):
-                    break
-                elif sampleNum > 50:
-                    break
+            with registry.acquire() as models:
+                detector = models.detector
+                if ENROLL_MODE == "augment":
+                    sampleNum = captureAugmented(cam, detector, path, Enrollment, Name)
+                else:
+                    first = training_cache.next_sample_number(path)
+                    while True:
+                        ret, img = cam.read()
+                        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                        faces = detector.detect(gray, scale_factor=1.3, min_neighbors=5)
+                        for (x, y, w, h) in faces:
+                            cv2.rectangle(img, (x, y), (x + w, y + h), (255, 0, 0), 2)
+                            sampleNum = sampleNum + 1
+                            file_name = (
+                                f"{Name}_{Enrollment}_{first + sampleNum - 1}"
+                                f"{face_preprocess.FACE_EXT}"
+                            )
+                            face_preprocess.save_face(
+                                os.path.join(path, file_name),
+                                face_preprocess.face_crop(gray, (x, y, w, h)),
+                            )
+                            cv2.imshow("Frame", img)
+                        if cv2.waitKey(1) & 0xFF == ord("q"):
+                            break
+                        elif sampleNum > 50:
+                            break
             cam.release()
             cv2.destroyAllWindows()
-            row = [Enrollment, Name]
             details_path = os.path.join("StudentDetails", "studentdetails.csv")
-            os.makedirs(os.path.dirname(details_path), exist_ok=True)
-            write_header = not os.path.isfile(details_path) or os.path.getsize(details_path) == 0
-            with open(
-                details_path,
-                "a+",
-                newline="",
-            ) as csvFile:
-                writer = csv.writer(csvFile, delimiter=",")
-                if write_header:
-                    writer.writerow(["Enrollment", "Name"])
-                writer.writerow(row)
             res = "Images Saved for ER No:" + Enrollment + " Name:" + Name
+            if roster.add_student(details_path, Enrollment, Name):
+                db = attendance_db.get_db()
+                if db is not None:
+                    db.upsert_students([(Enrollment, Name)])
+            else:
+                # more images for a student who is already registered
+                res += " (already registered)"
             message.configure(text=res)
             text_to_speech(res)
         except FileExistsError as F:
             F = "Student Data already exists"
             text_to_speech(F)
+        except ValueError as e:
+            # non-numeric enrollment or empty name
+            text_to_speech(str(e))
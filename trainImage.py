@@ -1,38 +1,183 @@
 import csv
 import os, cv2
+import json
+import threading
 import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import datetime
 import time
-from PIL import ImageTk, Image
+
+import face_detector
+import face_preprocess
+import recognizer_backends
+import training_cache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+haarcasecade_path = os.path.join(BASE_DIR, "haarcascade_frontalface_alt.xml")
+MANIFEST_NAME = "manifest.json"
+# decoder threads for training images (cv2.imdecode releases the GIL)
+TRAIN_WORKERS = int(os.environ.get("TRAIN_WORKERS", 0)) or os.cpu_count() or 1
+TRAIN_BATCH_SIZE = 64
+
+# detectors are not re-entrant: one per decoder thread
+_local = threading.local()
+
+
+def _detector():
+    detector = getattr(_local, "detector", None)
+    if detector is None:
+        detector = face_detector.create_photo_detector(haarcasecade_path)
+        _local.detector = detector
+    return detector
 
 
 # Train Image
-def TrainImage(haarcasecade_path, trainimage_path, trainimagelabel_path, message,text_to_speech):
-    recognizer = cv2.face.LBPHFaceRecognizer_create()
-    detector = cv2.CascadeClassifier(haarcasecade_path)
-    faces, Id = getImagesAndLables(trainimage_path)
-    recognizer.train(faces, np.array(Id))
-    recognizer.save(trainimagelabel_path)
-    res = "Image Trained successfully"  # +",".join(str(f) for f in Id)
+def TrainImage(
+    haarcasecade_path,
+    trainimage_path,
+    trainimagelabel_path,
+    message,
+    text_to_speech,
+    incremental=True,
+    workers=None,
+):
+    res = trainModel(trainimage_path, trainimagelabel_path, incremental, workers)
     message.configure(text=res)
     text_to_speech(res)
 
 
-def getImagesAndLables(path):
-    # imagePath = [os.path.join(path, f) for d in os.listdir(path) for f in d]
-    newdir = [os.path.join(path, d) for d in os.listdir(path)]
-    imagePath = [
-        os.path.join(newdir[i], f)
-        for i in range(len(newdir))
-        for f in os.listdir(newdir[i])
-    ]
+def trainModel(
+    trainimage_path,
+    trainimagelabel_path,
+    incremental=True,
+    workers=None,
+    backend=None,
+):
+    """Train (or extend) the recognizer model from the packed training cache.
+
+    backend names a recognizer_backends backend (default RECOGNIZER_BACKEND);
+    it saves its model files next to trainimagelabel_path. The manifest
+    records the backend, the cache generation and how many cache rows the
+    model holds. When the cache only grew since then the new rows are
+    appended to the saved model; otherwise it is retrained from all rows.
+    """
+    cache_dir = training_cache.cache_dir_for(trainimagelabel_path)
+
+    def load_batches(paths, size, ids):
+        return iterImagesAndLables(paths, workers, size=size, ids=ids)
+
+    faces, labels, index = training_cache.sync_cache(
+        trainimage_path, cache_dir, load_batches
+    )
+    if len(labels) == 0:
+        raise ValueError("No training images found")
+
+    backend = recognizer_backends.get_backend(backend)
+    manifest_path = os.path.join(os.path.dirname(trainimagelabel_path), MANIFEST_NAME)
+    manifest = {}
+    if incremental and backend.has_model(trainimagelabel_path):
+        manifest = loadManifest(manifest_path)
+    trained = manifest.get("rows", 0)
+
+    changed = None  # labels whose samples changed; None = all
+    if (
+        manifest.get("backend", "lbph") == backend.name
+        and manifest.get("generation") == index["generation"]
+        and trained <= len(labels)
+    ):
+        # only new samples: extend the saved model instead of retraining
+        if trained == len(labels):
+            return "Model already up to date"
+        model = backend.extend(trainimagelabel_path, faces[trained:], labels[trained:])
+        changed = set(np.unique(labels[trained:]).tolist())
+        res = f"Model updated with {len(labels) - trained} new images"
+    else:
+        model = backend.train(faces, labels)
+        res = "Image Trained successfully"  # +",".join(str(f) for f in Id)
+    os.makedirs(os.path.dirname(trainimagelabel_path), exist_ok=True)
+    backend.save(model, trainimagelabel_path, changed)
+    saveManifest(
+        manifest_path,
+        {
+            "backend": backend.name,
+            "generation": index["generation"],
+            "rows": len(labels),
+        },
+    )
+    return res
+
+
+def iterImagesAndLables(
+    imagePaths, workers=None, batch_size=TRAIN_BATCH_SIZE, size=None, ids=None
+):
+    """Decode images on a thread pool, yielding (faces, ids) batches in input order.
+
+    Only a few batches per worker are in flight at a time, so memory stays
+    bounded however large the training set is. When size=(w, h) is given
+    every image goes through face_preprocess.training_face: full photos
+    and older raw crops are detected, aligned and equalized like a live
+    frame, so the model sees what recognition feeds it. Ids are parsed
+    from the file names unless given; unreadable images and images without
+    a face are skipped.
+    """
+    workers = workers or TRAIN_WORKERS
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(0, len(imagePaths), batch_size):
+            batch = imagePaths[i : i + batch_size]
+            batch_ids = None if ids is None else ids[i : i + batch_size]
+            pending.append(pool.submit(decodeBatch, batch, size, batch_ids))
+            if len(pending) > 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def decodeBatch(imagePaths, size=None, ids=None):
     faces = []
     Ids = []
-    for imagePath in imagePath:
-        pilImage = Image.open(imagePath).convert("L")
-        imageNp = np.array(pilImage, "uint8")
-        Id = int(os.path.split(imagePath)[-1].split("_")[1])
+    for n, imagePath in enumerate(imagePaths):
+        # np.fromfile + imdecode also handles non-ASCII paths on Windows
+        imageNp = cv2.imdecode(
+            np.fromfile(imagePath, dtype=np.uint8), cv2.IMREAD_GRAYSCALE
+        )
+        if imageNp is None:
+            continue
+        if size is not None:
+            imageNp = face_preprocess.training_face(
+                imageNp,
+                _detector(),
+                face_preprocess.is_preprocessed(imagePath, imageNp),
+            )
+            if imageNp is None:
+                continue
+            if (imageNp.shape[1], imageNp.shape[0]) != tuple(size):
+                imageNp = cv2.resize(imageNp, size, interpolation=cv2.INTER_AREA)
+        if ids is None:
+            Id = int(os.path.split(imagePath)[-1].split("_")[1])
+        else:
+            Id = ids[n]
         faces.append(imageNp)
         Ids.append(Id)
     return faces, Ids
+
+
+def loadManifest(manifest_path):
+    if not os.path.isfile(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def saveManifest(manifest_path, manifest):
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(manifest, fh)
+    os.replace(tmp, manifest_path)
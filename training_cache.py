@@ -0,0 +1,239 @@
+"""
+Packed training-set cache.
+
+All training faces are stored as one fixed-size uint8 array (faces.u8) and
+one int32 label array (labels.i32), both opened with numpy.memmap, plus an
+index.json holding the per-folder row offsets and the mtime/size/sha1 of
+every source image. Training then reads one sequential file instead of
+opening thousands of small JPEGs.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+
+FACE_SIZE = (100, 100)  # (width, height) every cached face is resized to
+CACHE_VERSION = 3  # 2: faces are equalized; 3: detected and aligned too
+FACES_FILE = "faces.u8"
+LABELS_FILE = "labels.i32"
+INDEX_FILE = "index.json"
+
+
+def cache_dir_for(trainimagelabel_path):
+    """Default cache location, next to Trainner.yml."""
+    return os.path.join(os.path.dirname(trainimagelabel_path), "cache")
+
+
+def folder_label(folder):
+    """Enrollment number from a '<enrollment>_<name>' folder, or None."""
+    try:
+        return int(folder.split("_")[0])
+    except ValueError:
+        return None
+
+
+def next_sample_number(folder):
+    """1 + the highest trailing _<n> of the images in a student folder.
+
+    New samples are numbered from here so they never overwrite (and so
+    never invalidate the cached rows of) existing images, whatever their
+    extension or gaps in the numbering.
+    """
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return 1
+    last = 0
+    for name in names:
+        stem = os.path.splitext(name)[0]
+        if "_" in stem:
+            tail = stem.rsplit("_", 1)[1]
+            if tail.isdigit():
+                last = max(last, int(tail))
+    return last + 1
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def empty_index(size=FACE_SIZE):
+    return {
+        "version": CACHE_VERSION,
+        "generation": uuid.uuid4().hex,
+        "size": list(size),
+        "count": 0,
+        "folders": {},
+    }
+
+
+def load_index(cache_dir):
+    path = os.path.join(cache_dir, INDEX_FILE)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path) as fh:
+            index = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != CACHE_VERSION:
+        return None
+    return index
+
+
+def save_index(cache_dir, index):
+    path = os.path.join(cache_dir, INDEX_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(index, fh)
+    os.replace(tmp, path)
+
+
+def scan_images(trainimage_path):
+    """Return {folder: {image name: {mtime, size}}} for labelled folders."""
+    folders = {}
+    if not os.path.isdir(trainimage_path):
+        return folders
+    for d in sorted(os.listdir(trainimage_path)):
+        folder = os.path.join(trainimage_path, d)
+        if not os.path.isdir(folder) or folder_label(d) is None:
+            continue
+        images = {}
+        for f in sorted(os.listdir(folder)):
+            st = os.stat(os.path.join(folder, f))
+            images[f] = {"mtime": st.st_mtime, "size": st.st_size}
+        folders[d] = images
+    return folders
+
+
+def plan_sync(trainimage_path, index, size=FACE_SIZE):
+    """Compare the image tree with the cache index.
+
+    Returns (stale, new_images, seen) where stale is True when a cached image
+    was deleted or modified (the cache must be rebuilt), new_images is a
+    sorted list of (folder, image name) still to be appended and seen holds
+    the refreshed per-image metadata.
+    """
+    current = scan_images(trainimage_path)
+    if index is None or list(index["size"]) != list(size):
+        return True, [], current
+    cached = index["folders"]
+    stale = any(d not in current for d in cached)
+    new_images = []
+    seen = {}
+    for d, images in current.items():
+        old_images = cached.get(d, {}).get("images", {})
+        stale = stale or any(f not in images for f in old_images)
+        seen[d] = {}
+        for f, info in images.items():
+            old = old_images.get(f)
+            if old and old["mtime"] == info["mtime"] and old["size"] == info["size"]:
+                seen[d][f] = old
+                continue
+            entry = dict(info, sha1=file_hash(os.path.join(trainimage_path, d, f)))
+            seen[d][f] = entry
+            if old is None:
+                new_images.append((d, f))
+            elif old.get("sha1") != entry["sha1"]:
+                stale = True
+    return stale, new_images, seen
+
+
+def append_rows(cache_dir, index, faces, labels):
+    """Append faces/labels to the packed arrays; returns the first new row."""
+    w, h = index["size"]
+    row_bytes = w * h
+    start = index["count"]
+    os.makedirs(cache_dir, exist_ok=True)
+    for name, data, item in (
+        (FACES_FILE, np.ascontiguousarray(faces, dtype=np.uint8), row_bytes),
+        (LABELS_FILE, np.ascontiguousarray(labels, dtype=np.int32), 4),
+    ):
+        path = os.path.join(cache_dir, name)
+        with open(path, "ab") as fh:
+            # drop rows written by an interrupted sync that never reached the index
+            fh.truncate(start * item)
+            fh.seek(start * item)
+            fh.write(data.tobytes())
+            fh.flush()
+            os.fsync(fh.fileno())
+    index["count"] = start + len(labels)
+    return start
+
+
+def load_cache(cache_dir):
+    """Memory-map the cache; returns (faces, labels, index) or None."""
+    index = load_index(cache_dir)
+    if index is None:
+        return None
+    w, h = index["size"]
+    n = index["count"]
+    if n == 0:
+        return (
+            np.zeros((0, h, w), dtype=np.uint8),
+            np.zeros(0, dtype=np.int32),
+            index,
+        )
+    faces = np.memmap(
+        os.path.join(cache_dir, FACES_FILE), dtype=np.uint8, mode="r", shape=(n, h, w)
+    )
+    labels = np.memmap(
+        os.path.join(cache_dir, LABELS_FILE), dtype=np.int32, mode="r", shape=(n,)
+    )
+    return faces, labels, index
+
+
+def sync_cache(trainimage_path, cache_dir, load_batches, size=FACE_SIZE):
+    """Bring the cache up to date with trainimage_path and return load_cache().
+
+    load_batches(paths, size, ids) must yield (faces, ids) batches in input
+    order, skipping unreadable images; trainImage.iterImagesAndLables is the
+    parallel decoder used for this.
+    New images are appended; the cache is rebuilt from scratch when images
+    were removed or changed.
+    """
+    index = load_index(cache_dir)
+    stale, new_images, seen = plan_sync(trainimage_path, index, size)
+    if stale:
+        index = empty_index(size)
+        for name in (FACES_FILE, LABELS_FILE):
+            path = os.path.join(cache_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+        new_images = [(d, f) for d in sorted(seen) for f in sorted(seen[d])]
+        for d in seen:
+            for f, info in seen[d].items():
+                if "sha1" not in info:
+                    info["sha1"] = file_hash(os.path.join(trainimage_path, d, f))
+
+    if new_images or stale:
+        paths = [os.path.join(trainimage_path, d, f) for d, f in new_images]
+        # decode with the row number as id so skipped images keep alignment
+        ids = list(range(len(paths)))
+        for faces, rows in load_batches(paths, tuple(size), ids):
+            batch_folders = [new_images[r][0] for r in rows]
+            labels = [folder_label(d) for d in batch_folders]
+            first = append_rows(
+                cache_dir, index, np.array(faces, dtype=np.uint8), labels
+            )
+            for i, d in enumerate(batch_folders):
+                entry = index["folders"].setdefault(d, {"segments": []})
+                segments = entry["segments"]
+                if segments and sum(segments[-1]) == first + i:
+                    segments[-1][1] += 1
+                else:
+                    segments.append([first + i, 1])
+        for d, images in seen.items():
+            index["folders"].setdefault(d, {"segments": []})
+            index["folders"][d]["label"] = folder_label(d)
+            index["folders"][d]["images"] = images
+        os.makedirs(cache_dir, exist_ok=True)
+        save_index(cache_dir, index)
+    return load_cache(cache_dir)
@@ -0,0 +1,90 @@
+"""
+Per-student vote accumulation for a recognition session.
+
+Every recognizer prediction below the per-frame threshold is a vote for
+that enrollment. Votes and confidence sums live in NumPy arrays indexed by
+the position of the enrollment in the sorted roster, so adding a batch of
+predictions is one searchsorted + np.add.at. A student is committed as
+present only after min_votes agreeing predictions whose mean LBPH distance
+is below max_mean_conf.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class VoteAccumulator:
+    def __init__(
+        self, enrollments, min_votes=3, accept_conf=70, max_mean_conf=70
+    ):
+        self.labels = np.unique(np.asarray(list(enrollments), dtype=np.int64))
+        self.min_votes = min_votes
+        self.accept_conf = accept_conf
+        self.max_mean_conf = max_mean_conf
+        self.votes = np.zeros(len(self.labels), dtype=np.int32)
+        self.conf_sum = np.zeros(len(self.labels), dtype=np.float64)
+        self.best_conf = np.full(len(self.labels), np.inf)
+        self.lock = threading.Lock()
+
+    def _index(self, ids):
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if len(self.labels) == 0:
+            return np.zeros(len(ids), dtype=np.intp), np.zeros(len(ids), dtype=bool)
+        idx = np.minimum(np.searchsorted(self.labels, ids), len(self.labels) - 1)
+        return idx, self.labels[idx] == ids
+
+    def add(self, ids, confs):
+        """Record predictions; ids not on the roster are ignored."""
+        confs = np.asarray(confs, dtype=np.float64).reshape(-1)
+        idx, known = self._index(ids)
+        keep = known & (confs < self.accept_conf)
+        idx, confs = idx[keep], confs[keep]
+        with self.lock:
+            np.add.at(self.votes, idx, 1)
+            np.add.at(self.conf_sum, idx, confs)
+            np.minimum.at(self.best_conf, idx, confs)
+
+    def committed(self):
+        """Boolean mask over self.labels of students marked present."""
+        with self.lock:
+            votes = self.votes.copy()
+            conf_sum = self.conf_sum.copy()
+        mean = conf_sum / np.maximum(votes, 1)
+        return (votes >= self.min_votes) & (mean < self.max_mean_conf)
+
+    def is_committed(self, Id):
+        idx, known = self._index([Id])
+        return bool(known[0] and self.committed()[idx[0]])
+
+    def summary(self, names):
+        """Per-student vote/confidence table for everyone with at least one vote."""
+        with self.lock:
+            votes = self.votes.copy()
+            conf_sum = self.conf_sum.copy()
+            best = self.best_conf.copy()
+        seen = votes > 0
+        present = self.committed()[seen]
+        labels = self.labels[seen]
+        return pd.DataFrame(
+            {
+                "Enrollment": labels,
+                "Name": [names.get(int(i), "Unknown") for i in labels],
+                "Votes": votes[seen],
+                "MeanConf": np.round(conf_sum[seen] / votes[seen], 2),
+                "BestConf": np.round(best[seen], 2),
+                "Present": present,
+            }
+        )
+
+    def attendance(self, names):
+        """Committed students as the Enrollment/Name frame written per session."""
+        mask = self.committed()
+        labels = self.labels[mask]
+        return pd.DataFrame(
+            {
+                "Enrollment": labels,
+                "Name": [names.get(int(i), "Unknown") for i in labels],
+            }
+        )